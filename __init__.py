@@ -1,11 +1,16 @@
 # https://github.com/WiresoulStudio/W_Mesh_28x/blob/327bf7a5d26f134288627b253732a8470e05f7b9/__init__.py
 import bpy
-from bpy.props import PointerProperty, EnumProperty
-
-from . import sinegear
-from .curvify import Curvify, CurvifyData
-from .meshify import Meshify, MeshifyData
-from .sinegear import SineGear, SineGearData
+from bpy.props import BoolProperty, PointerProperty, EnumProperty, FloatProperty, IntProperty
+
+from . import curvify, dependencies, journal, meshify, scheduler, sinegear, transactions, workers
+from .curvify import TRACE_CACHE_ENTRIES, TRACE_CACHE_MEMORY, Curvify, CurvifyData, CurvifySelected, \
+    configure_trace_cache, trace_cache
+from .dependencies import dependents_index
+from .globals import get_preferences, get_sync_handler, sync_handlers
+from .journal import write_journal
+from .meshify import Meshify, MeshifyData, MeshifySelected
+from .scheduler import sync_scheduler
+from .sinegear import SineGear, SineGearData, SineGearSweep
 
 bl_info = {
     "name": "BlaBlaCAD",
@@ -28,6 +33,60 @@ def TypeProperty():
         default="NONE")
 
 
+class BlaBlaCADPreferences(bpy.types.AddonPreferences):
+    bl_idname = __name__
+
+    deferred_sync: BoolProperty(
+        name="Deferred sync",
+        default=True,
+        description="Coalesce updates during interactive edits instead of syncing on every depsgraph update")
+    max_sync_rate: FloatProperty(
+        name="Max sync rate",
+        default=20.0,
+        description="Maximum number of deferred syncs per second",
+        min=1.0,
+        soft_max=60.0)
+    trace_cache_entries: IntProperty(
+        name="Offset cache entries",
+        default=TRACE_CACHE_ENTRIES,
+        description="Maximum number of offset spline traces kept in memory",
+        min=0,
+        update=lambda self, _: configure_trace_cache(self))
+    trace_cache_memory: FloatProperty(
+        name="Offset cache memory (MB)",
+        default=TRACE_CACHE_MEMORY,
+        description="Maximum memory used by the cached offset traces",
+        min=0.0,
+        update=lambda self, _: configure_trace_cache(self))
+    background_offset: BoolProperty(
+        name="Background offset",
+        default=False,
+        description="Offset large splines in background processes instead of blocking the interface")
+    background_workers: IntProperty(
+        name="Background workers",
+        default=0,
+        description="Number of background processes, 0 for one less than the number of processors",
+        min=0,
+        soft_max=16)
+
+    def draw(self, context):
+        layout = self.layout
+        layout.use_property_split = True
+        layout.prop(self, "deferred_sync")
+        rate_col = layout.column()
+        rate_col.enabled = self.deferred_sync
+        rate_col.prop(self, "max_sync_rate")
+        if trace_cache is not None:
+            layout.prop(self, "trace_cache_entries")
+            layout.prop(self, "trace_cache_memory")
+            layout.label(text="Offset cache: %d entries, %.1f MB, %d hits, %d misses" % (
+                len(trace_cache.entries), trace_cache.bytes / 2 ** 20, trace_cache.hits, trace_cache.misses))
+            layout.prop(self, "background_offset")
+            workers_col = layout.column()
+            workers_col.enabled = self.background_offset
+            workers_col.prop(self, "background_workers")
+
+
 class BlaBlaCADData(bpy.types.PropertyGroup):
     curvify_data: PointerProperty(type=CurvifyData)
     meshify_data: PointerProperty(type=MeshifyData)
@@ -42,34 +101,118 @@ class BlaBlaCADMenu(bpy.types.Menu):
     def draw(self, context):
         self.layout.label(text="BlaBlaCAD", icon='WORLD_DATA')
         self.layout.operator(Curvify.bl_idname)
+        self.layout.operator(CurvifySelected.bl_idname)
         self.layout.operator(Meshify.bl_idname)
+        self.layout.operator(MeshifySelected.bl_idname)
         self.layout.operator(SineGear.bl_idname)
+        self.layout.operator(SineGearSweep.bl_idname)
 
 
 def blablacad_menu(self, context):
     self.layout.menu(BlaBlaCADMenu.bl_idname)
 
 
+def sync_objs(objs, context):
+    sorted_objs, cyclic_objs = dependents_index.sort(objs)
+    if len(cyclic_objs) > 0:
+        print("BlaBlaCAD: source cycle, not syncing %s" % ", ".join(obj.name for obj in cyclic_objs))
+    for obj, geometry in sorted_objs:
+        try:
+            sync_handler = get_sync_handler(obj)
+        except ReferenceError:
+            continue
+        if sync_handler is not None:
+            sync_handler(obj, context, geometry)
+
+
+@bpy.app.handlers.persistent
+def detect_changes(_, depsgraph=None):
+    processed = detect_changes.processed
+    context = bpy.context
+    depsgraph = depsgraph or context.evaluated_depsgraph_get()
+    is_depsgraph_update_root = len(processed) == 0
+    dirty_objs = dict()
+
+    # Transform-only syncs are cheap and idempotent, only geometry syncs are deduplicated across nested updates
+    def update_obj(obj, geometry):
+        key = obj.as_pointer()
+        if obj.blablacad_data.type in sync_handlers and key not in processed:
+            if geometry:
+                processed.add(key)
+            dirty_objs[key] = (obj, geometry or key in dirty_objs and dirty_objs[key][1])
+
+    changed_objs = list()
+    for update in depsgraph.updates:
+        changed_obj = update.id.original
+        if isinstance(changed_obj, bpy.types.Object):
+            if not update.is_updated_geometry and not update.is_updated_transform:
+                continue
+            changed_objs.append((changed_obj, update.is_updated_geometry))
+
+    # Objects written by the add-on since the last update are up to date for their own update, the propagation starts
+    # from their dependents instead. They still sync when reached from a source which changed.
+    written_objs = write_journal.consume()
+    propagated_objs = list()
+    for obj, geometry in changed_objs:
+        written_geometry = written_objs.get(obj.as_pointer())
+        if written_geometry is None or (geometry and not written_geometry):
+            propagated_objs.append((obj, geometry))
+        else:
+            propagated_objs.extend((dependent, geometry) for dependent in dependents_index.find_dependents(obj))
+
+    # The whole downstream chain is synced in one pass, sources first, instead of one link per depsgraph update
+    for obj, geometry in dependents_index.find_downstream(propagated_objs).values():
+        update_obj(obj, geometry)
+
+    preferences = get_preferences(context)
+    if preferences is not None and preferences.deferred_sync:
+        for obj, geometry in dirty_objs.values():
+            sync_scheduler.schedule(obj, geometry, 1.0 / preferences.max_sync_rate)
+    else:
+        sync_objs(dirty_objs.values(), context)
+
+    if is_depsgraph_update_root:
+        detect_changes.processed = set()
+
+
 def register():
+    dependencies.register()
+    journal.register()
+    transactions.register()
+    scheduler.register(sync_objs)
+    workers.register()
     curvify.register()
     meshify.register()
     sinegear.register()
 
+    bpy.utils.register_class(BlaBlaCADPreferences)
+    configure_trace_cache(get_preferences(bpy.context))
     bpy.utils.register_class(BlaBlaCADData)
     bpy.types.Object.blablacad_data = PointerProperty(type=BlaBlaCADData)
     bpy.utils.register_class(BlaBlaCADMenu)
     bpy.types.VIEW3D_MT_mesh_add.append(blablacad_menu)
 
+    detect_changes.processed = set()
+    bpy.app.handlers.depsgraph_update_post.append(detect_changes)
+
 
 def unregister():
+    bpy.app.handlers.depsgraph_update_post.remove(detect_changes)
+
     bpy.types.VIEW3D_MT_mesh_add.remove(blablacad_menu)
     bpy.utils.unregister_class(BlaBlaCADMenu)
     del bpy.types.Object.blablacad_data
     bpy.utils.unregister_class(BlaBlaCADData)
+    bpy.utils.unregister_class(BlaBlaCADPreferences)
 
     sinegear.unregister()
     meshify.unregister()
     curvify.unregister()
+    workers.unregister()
+    scheduler.unregister()
+    transactions.unregister()
+    journal.unregister()
+    dependencies.unregister()
 
 
 if __name__ == "__main__":
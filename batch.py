@@ -0,0 +1,187 @@
+"""Headless SineGear generation.
+
+    blender --background --python-exit-code 1 --python batch.py -- --input gears.json --output gears.blend --jobs 4
+
+The input is a JSON list of objects, or a CSV file with a header row, giving SineGear parameters by property name and
+optionally an object name and a location, given in CSV files as three numbers separated by spaces. Gears without
+location are laid out on a grid. The output is a .blend file or an .obj or .stl export. With several jobs, gears are
+generated by as many background Blender processes and their results are merged into the output.
+
+The module can also be imported from Blender, run() then adds the gears to the current file before writing the output.
+"""
+import argparse
+import csv
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import bpy
+
+SCRIPT_PATH = os.path.abspath(__file__)
+
+
+def load_addon():
+    # Run as a script, the add-on is imported from the parent directory and registered unless enabled already
+    if __package__:
+        return sys.modules[__package__]
+    directory = os.path.dirname(SCRIPT_PATH)
+    if os.path.dirname(directory) not in sys.path:
+        sys.path.insert(0, os.path.dirname(directory))
+    addon = importlib.import_module(os.path.basename(directory))
+    if not hasattr(bpy.types.Object, "blablacad_data"):
+        addon.register()
+    return addon
+
+
+def read_entries(path):
+    with open(path, newline="") as file:
+        if path.lower().endswith(".csv"):
+            entries = list(csv.DictReader(file))
+            for entry in entries:
+                if entry.get("location"):
+                    entry["location"] = parse_location(entry["location"])
+            return entries
+        else:
+            return json.load(file)
+
+
+def parse_location(value):
+    location = [float(component) for component in value.replace(",", " ").split()]
+    if len(location) != 3:
+        raise ValueError(f"Location {value} must have three components")
+    return location
+
+
+def sinegear_parameters(addon, entry):
+    properties = addon.sinegear.SineGearData.bl_rna.properties
+    parameters = dict()
+    for name, value in entry.items():
+        if name in ("name", "location") or value == "":
+            continue
+        if name not in properties or name == "rna_type":
+            raise ValueError(f"Unknown SineGear parameter {name}")
+
+        property_type = properties[name].type
+        if property_type == "BOOLEAN":
+            parameters[name] = value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes")
+        elif property_type == "INT":
+            parameters[name] = int(value)
+        elif property_type == "FLOAT":
+            parameters[name] = float(value)
+        else:
+            parameters[name] = str(value)
+    return parameters
+
+
+def generate(addon, context, entries):
+    parameter_sets = [sinegear_parameters(addon, entry) for entry in entries]
+    offsets = [entry["location"] for entry in entries]
+    objs = addon.sinegear.generate_sinegears(context, parameter_sets, offsets)
+    for obj, entry in zip(objs, entries):
+        if entry.get("name"):
+            obj.name = entry["name"]
+    return objs
+
+
+def generate_jobs(addon, context, entries, jobs):
+    chunks = [entries[job::jobs] for job in range(jobs)]
+    with tempfile.TemporaryDirectory() as directory:
+        processes = list()
+        for job, chunk in enumerate(chunks):
+            input_path = os.path.join(directory, f"job{job}.json")
+            output_path = os.path.join(directory, f"job{job}.blend")
+            with open(input_path, "w") as file:
+                json.dump(chunk, file)
+            processes.append((subprocess.Popen([bpy.app.binary_path, "--background", "--factory-startup",
+                                                "--python-exit-code", "1", "--python", SCRIPT_PATH, "--",
+                                                "--input", input_path, "--output", output_path, "--jobs", "1"]),
+                              output_path))
+
+        failed_jobs = [job for job, (process, _) in enumerate(processes) if process.wait() != 0]
+        if len(failed_jobs) > 0:
+            raise RuntimeError(f"Background jobs {failed_jobs} failed")
+
+        objs = list()
+        for _, output_path in processes:
+            with bpy.data.libraries.load(output_path, link=False) as (data_from, data_to):
+                data_to.objects = data_from.objects
+            for obj in data_to.objects:
+                if obj is not None:
+                    context.collection.objects.link(obj)
+                    objs.append(obj)
+    share_merged_geometry(addon, objs)
+    return objs
+
+
+def share_merged_geometry(addon, objs):
+    # Each job generated its own shared datablocks, identical ones are merged back into one
+    shared_geometry = addon.sinegear.shared_geometry
+    shared_data = dict()
+    for obj in objs:
+        key = obj.data.get(addon.sinegear.SHARED_GEOMETRY_KEY) if obj.data is not None else None
+        if key is None:
+            continue
+        data = shared_data.setdefault(key, obj.data)
+        if obj.data != data:
+            previous_data = obj.data
+            obj.data = data
+            if previous_data.users == 0:
+                addon.sinegear.remove_datablock(previous_data)
+    shared_geometry.rebuild()
+
+
+def write_output(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".blend":
+        bpy.ops.wm.save_as_mainfile(filepath=path, check_existing=False)
+    elif extension == ".obj":
+        if "obj_export" in dir(bpy.ops.wm):
+            bpy.ops.wm.obj_export(filepath=path)
+        else:
+            bpy.ops.export_scene.obj(filepath=path)
+    elif extension == ".stl":
+        if "stl_export" in dir(bpy.ops.wm):
+            bpy.ops.wm.stl_export(filepath=path)
+        else:
+            bpy.ops.export_mesh.stl(filepath=path)
+    else:
+        raise ValueError(f"Unsupported output format {extension}")
+
+
+def run(entries, output, jobs=1):
+    """Generate a SineGear per entry and write them to the output file, using the given number of processes."""
+    addon = load_addon()
+    context = bpy.context
+    entries = [dict(entry) for entry in entries]
+    offsets = addon.sinegear.grid_layout([sinegear_parameters(addon, entry) for entry in entries])
+    for entry, offset in zip(entries, offsets):
+        if not entry.get("location"):
+            entry["location"] = offset
+
+    jobs = min(jobs or os.cpu_count() or 1, len(entries))
+    if jobs > 1:
+        objs = generate_jobs(addon, context, entries, jobs)
+    else:
+        objs = generate(addon, context, entries)
+    write_output(output)
+    return objs
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else list()
+    parser = argparse.ArgumentParser(prog="blender --background --python batch.py --",
+                                     description="Generate SineGear objects from a JSON or CSV parameter list")
+    parser.add_argument("--input", required=True, help="JSON or CSV parameter list")
+    parser.add_argument("--output", required=True, help=".blend, .obj or .stl output file")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of Blender processes, 0 for one per processor")
+    args = parser.parse_args(argv)
+
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    run(read_entries(args.input), os.path.abspath(args.output), args.jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,138 @@
+import functools
 import math
 
 import bpy
 import bpy_extras
 import hashlib
 from array import array
-from bpy.props import BoolProperty, FloatProperty, PointerProperty, StringProperty
-from curve_tools import internal as curve_tools
-from mathutils import Vector
+from bpy.props import BoolProperty, CollectionProperty, FloatProperty, IntProperty, PointerProperty, StringProperty
+
+from .dependencies import dependents_index, reindex
+from .globals import append_file_handler, get_curvify_data, get_curvify_enum, get_preferences, has_curvify_data, \
+    make_curvify_data, register_sync_handler, remove_file_handler, unregister_sync_handler
+from .journal import write_journal
+from .utils import Lockable, ObjectCache, add_synced_objects, copy_curve_settings, copy_property_group, copy_spline, \
+    copy_struct_settings, fingerprint_curve, hash_curve_settings, hash_spline, if_unlocked, numpy, spline_buffers
+from .workers import offset_workers
+
+try:
+    from .offset import TraceCache, bezier_polyline, offset_polyline
+except ImportError:
+    # The offset engine needs NumPy, curves are then copied without offset
+    TraceCache = bezier_polyline = offset_polyline = None
+
+TRACE_CACHE_ENTRIES = 1024
+TRACE_CACHE_MEMORY = 64.0
+
+# Polylines with fewer points are offset faster in Blender than shipped to a background process
+BACKGROUND_OFFSET_POINTS = 4096
+
+# Source polylines of the last sync before offset, with the source fingerprint when not incremental
+source_polylines = ObjectCache()
+trace_cache = TraceCache(TRACE_CACHE_ENTRIES, int(TRACE_CACHE_MEMORY * 2 ** 20)) if TraceCache is not None else None
+# Traces computed in the background, waiting for the sync of their object
+background_traces = dict()
+# Background jobs finished since they were last applied, by object name
+finished_jobs = dict()
+# Names of the objects waiting to be replaced by a curve object
+pending_retargets = set()
+
+
+def configure_trace_cache(preferences):
+    if trace_cache is not None and preferences is not None:
+        trace_cache.resize(preferences.trace_cache_entries, int(preferences.trace_cache_memory * 2 ** 20))
+
+
+def finish_background_offset(obj_name, source_index, key, traces):
+    # Jobs finishing in the same poll are applied together, syncing each object once
+    finished_jobs.setdefault(obj_name, list()).append((source_index, key, traces))
+    if not bpy.app.timers.is_registered(apply_finished_jobs):
+        bpy.app.timers.register(apply_finished_jobs)
+
+
+def apply_finished_jobs():
+    jobs_by_obj = dict(finished_jobs)
+    finished_jobs.clear()
+    for obj_name, jobs in jobs_by_obj.items():
+        apply_background_traces(obj_name, jobs)
+    return None
+
+
+def apply_background_traces(obj_name, jobs):
+    obj = bpy.data.objects.get(obj_name)
+    if obj is None or not has_curvify_data(obj):
+        return
+    curvify_data = get_curvify_data(obj)
+    source_object = curvify_data.source_object
+    if source_object is None or source_object.type != "CURVE":
+        return
+
+    # Results are dropped when the source spline or the offset parameters changed since the job was submitted
+    source_curve: bpy.types.Curve = source_object.evaluated_get(bpy.context.evaluated_depsgraph_get()).data
+    keys = list()
+    for source_index, key, traces in jobs:
+        if source_index >= len(source_curve.splines):
+            continue
+        source_spline = source_curve.splines[source_index]
+        if curvify_data.offset_key(hash_spline_geometry(source_spline)) != key:
+            continue
+
+        if traces is None:
+            # The background job failed, offset the spline in Blender instead
+            traces = offset_polyline(spline_polyline(source_spline),
+                                     source_spline.use_cyclic_u,
+                                     curvify_data.offset,
+                                     curvify_data.resolution,
+                                     curvify_data.round_line_join)
+        background_traces[key] = traces
+        keys.append(key)
+        for spline_data in curvify_data.splines:
+            if spline_data.source_index == source_index:
+                spline_data.digest = ""
+    if len(keys) == 0:
+        return
+
+    curvify_data.digest = ""
+    curvify_data.fingerprint = ""
+    curvify_data.curvify(bpy.context)
+    # Traces the sync did not pick up, when the object is not kept in sync, are cached for a later one
+    for key in keys:
+        traces = background_traces.pop(key, None)
+        if traces is not None:
+            trace_cache.put(key, traces)
 
-from .globals import get_curvify_data, get_curvify_enum, has_curvify_data, make_curvify_data
-from .utils import Lockable, hash_curve, if_unlocked, copy_curve
 
-
-def is_curvify_source(obj):
-    return "curvify_source" in obj and obj["curvify_source"]
+# noinspection PyPep8Naming
+def DigestProperty():
+    return StringProperty(
+        name="Curve digest",
+        default="",
+        description="Curve digest to detect changes")
 
 
-def set_curvify_source(obj):
-    obj["curvify_source"] = True
+# noinspection PyPep8Naming
+def FingerprintProperty():
+    return StringProperty(
+        name="Curve fingerprint",
+        default="",
+        description="Cheap curve fingerprint to detect changes before computing the digest")
 
 
 # noinspection PyPep8Naming
-def DigestProperty():
+def ParametersDigestProperty():
     return StringProperty(
-        name="Curve digest",
+        name="Parameters digest",
         default="",
-        description="Curve digest to detect changes")
+        description="Digest of the offset parameters the splines were built with")
+
+
+# noinspection PyPep8Naming
+def IncrementalProperty(update=None):
+    return BoolProperty(
+        name="Incremental",
+        default=True,
+        description="Only rebuild the splines which changed in the source curve",
+        update=update)
 
 
 # noinspection PyPep8Naming
@@ -121,82 +228,382 @@ def RoundLineJoinProperty(update=None):
         update=update)
 
 
+def hash_source_splines(source_curve: bpy.types.Curve):
+    return [hash_spline_geometry(spline) for spline in source_curve.splines]
+
+
+def hash_splines_digest(curve: bpy.types.Curve, spline_digests, parameters):
+    # Curve settings apply to every spline, they are hashed once here instead of in each spline digest
+    splines_hash = hashlib.sha1()
+    hash_curve_settings(splines_hash, curve)
+    splines_hash.update(bytes("".join(spline_digests), "ascii"))
+    splines_hash.update(parameters)
+    return splines_hash.hexdigest()
+
+
+def hash_spline_geometry(spline: bpy.types.Spline, buffers=None):
+    spline_hash = hashlib.sha1()
+    hash_spline(spline_hash, spline, buffers)
+    return spline_hash.hexdigest()
+
+
+def spline_polyline(spline: bpy.types.Spline, buffers=None):
+    buffers = buffers or spline_buffers(spline)
+    if spline.type == "BEZIER":
+        co, handle_left, handle_right = (buffers[attribute].reshape(-1, 3)
+                                         for attribute in ("co", "handle_left", "handle_right"))
+        return bezier_polyline(co, handle_left, handle_right, spline.use_cyclic_u)
+    else:
+        return buffers["co"].reshape(-1, 4)[:, :3]
+
+
+def add_poly_spline(curve: bpy.types.Curve, trace, cyclic):
+    spline: bpy.types.Spline = curve.splines.new("POLY")
+    spline.points.add(len(trace) - 1)
+    spline.points.foreach_set("co", numpy.hstack((trace, numpy.ones((len(trace), 1)))).astype(numpy.float32).ravel())
+    spline.use_cyclic_u = cyclic
+    return spline
+
+
+def schedule_retarget(obj: bpy.types.Object):
+    # Removing an object from one of its own property updates frees the ID Blender tags next, a timer swaps it instead
+    pending_retargets.add(obj.name)
+    if not bpy.app.timers.is_registered(retarget_pending):
+        bpy.app.timers.register(retarget_pending)
+
+
+def retarget_pending():
+    obj_names = list(pending_retargets)
+    pending_retargets.clear()
+    for obj_name in obj_names:
+        obj = bpy.data.objects.get(obj_name)
+        if obj is not None and has_curvify_data(obj) and obj.type != "CURVE":
+            get_curvify_data(retarget_to_curve(obj)).curvify(bpy.context)
+    return None
+
+
+def retarget_to_curve(obj: bpy.types.Object):
+    # Object data can not change type, a curve object with the same settings takes the place of the object
+    name = obj.name
+    curve_obj = bpy.data.objects.new(name, bpy.data.curves.new("Curvify", type="CURVE"))
+    for collection in obj.users_collection:
+        collection.objects.link(curve_obj)
+    curve_obj.parent = obj.parent
+    curve_obj.matrix_parent_inverse = obj.matrix_parent_inverse
+    curve_obj.rotation_mode = obj.rotation_mode
+    curve_obj.matrix_basis = obj.matrix_basis
+    copy_object_settings(curve_obj, obj)
+
+    curvify_data: CurvifyData = make_curvify_data(curve_obj)
+    curvify_data.lock()
+    copy_property_group(curvify_data, get_curvify_data(obj), exclude={"digest", "fingerprint", "parameters_digest"})
+    curvify_data.unlock()
+
+    # Parenting, selection, modifiers and sources pointing to the object move to the curve object
+    data = obj.data
+    obj.user_remap(curve_obj)
+    bpy.data.objects.remove(obj)
+    if isinstance(data, bpy.types.Mesh) and data.users == 0:
+        bpy.data.meshes.remove(data)
+    curve_obj.name = name
+    dependents_index.rebuild()
+    return curve_obj
+
+
+def copy_object_settings(curve_obj: bpy.types.Object, obj: bpy.types.Object):
+    # Modifiers and constraints which curves do not support are dropped, with a message
+    for modifier in obj.modifiers:
+        try:
+            curve_modifier = curve_obj.modifiers.new(modifier.name, modifier.type)
+        except (RuntimeError, TypeError):
+            curve_modifier = None
+        if curve_modifier is None:
+            print("BlaBlaCAD: %s modifier %s not supported on curves, dropped" % (obj.name, modifier.name))
+        else:
+            copy_struct_settings(curve_modifier, modifier)
+    for constraint in obj.constraints:
+        curve_constraint = curve_obj.constraints.new(constraint.type)
+        copy_struct_settings(curve_constraint, constraint)
+
+    for slot in obj.material_slots:
+        curve_obj.data.materials.append(slot.material if slot.link == "DATA" else None)
+    for slot, curve_slot in zip(obj.material_slots, curve_obj.material_slots):
+        curve_slot.link = slot.link
+        if slot.link == "OBJECT":
+            curve_slot.material = slot.material
+
+    curve_obj.hide_viewport = obj.hide_viewport
+    curve_obj.hide_render = obj.hide_render
+    curve_obj.hide_select = obj.hide_select
+    curve_obj.display_type = obj.display_type
+    curve_obj.show_in_front = obj.show_in_front
+    try:
+        curve_obj.hide_set(obj.hide_get())
+    except RuntimeError:
+        # Objects outside of the view layer have no hidden state
+        pass
+
+    for key in obj.keys():
+        if key not in curve_obj:
+            curve_obj[key] = obj[key]
+
+
+class CurvifySplineData(bpy.types.PropertyGroup):
+    digest: StringProperty(
+        name="Spline digest",
+        default="",
+        description="Source spline digest to detect changes")
+    outputs: IntProperty(
+        name="Outputs",
+        default=0,
+        description="Number of consecutive splines generated from the source spline")
+    source_index: IntProperty(
+        name="Source index",
+        default=0,
+        description="Index of the source spline")
+
+
 class CurvifyData(bpy.types.PropertyGroup, Lockable):
 
     def curvify(self, context):
         if self.source_object is not None and self.keep_in_sync:
             obj: bpy.types.Object = self.id_data
-            spline: bpy.types.Spline
 
-            if self.sync_location:
-                if obj.location != self.source_object.location:
-                    obj.location = self.source_object.location
             if self.sync_curve:
+                if obj.type != "CURVE":
+                    # The digests are not copied, the new curve object builds all its splines
+                    schedule_retarget(obj)
+                    return
+
                 depsgraph = context.evaluated_depsgraph_get()
                 source_evaluated_object = self.source_object.evaluated_get(depsgraph)
                 source_curve: bpy.types.Curve = source_evaluated_object.data
 
-                source_hash = hashlib.sha1()
-                hash_curve(source_hash, source_curve)
-                source_hash.update(array("d", [self.offset, self.resolution]))
-                source_digest = source_hash.hexdigest()
-
-                if self.digest != source_digest:
-                    self.digest = source_digest
-                    if obj.type == "MESH":
-                        bpy.ops.object.mode_set(mode="EDIT")
-                        try:
-                            bpy.ops.mesh.select_all(action='SELECT')
-                            bpy.ops.mesh.delete(type='VERT')
-                        except:
-                            pass
-                        bpy.ops.mesh.primitive_plane_add(enter_editmode=False, location=(0, 0, 0))
-                        bpy.ops.object.mode_set(mode="OBJECT")
-                        bpy.ops.object.convert(target="CURVE", keep_original=False)
-                        bpy.ops.object.mode_set(mode="EDIT")
-                        try:
-                            bpy.ops.curve.select_all(action='SELECT')
-                            bpy.ops.curve.delete(type='VERT')
-                        except:
-                            pass
-                        bpy.ops.object.mode_set(mode="OBJECT")
-
-                    curve: bpy.types.Curve = obj.data
-                    copy_curve(curve, source_curve)
-
-                    for spline in curve.splines:
-                        if self.offset_enabled:
-                            origin = Vector((0.0, 0.0, 0.0))
-                            traces = curve_tools.offsetPolygonOfSpline(spline,
-                                                                       self.offset,
-                                                                       self.resolution,
-                                                                       self.round_line_join)
-                            for trace in traces:
-                                curve_tools.addPolygonSpline(obj,
-                                                             spline.use_cyclic_u,
-                                                             [vertex - origin for vertex in trace])
-
-                            curve.splines.remove(spline)
+                parameters = self.offset_parameters()
+                parameters_digest = hashlib.sha1(parameters).hexdigest()
+                previous_source = source_polylines.get(obj, (self.digest, self.fingerprint))
+
+                source_fingerprint = hashlib.sha1()
+                fingerprint_curve(source_fingerprint, source_curve)
+                hash_curve_settings(source_fingerprint, source_curve)
+                fingerprint = source_fingerprint.copy()
+                fingerprint.update(parameters)
+                fingerprint = fingerprint.hexdigest()
+
+                curve: bpy.types.Curve = obj.data
+                # Splines kept from the last sync must have been built with the same parameters
+                can_update = self.incremental and self.parameters_digest == parameters_digest \
+                    and self.can_update_splines(curve, source_curve)
+                if self.fingerprint != fingerprint and not can_update:
+                    # The source definitely changed and every spline is rebuilt, hashing each one as it is read
+                    spline_digests = None
+                    is_changed = True
+                else:
+                    spline_digests = hash_source_splines(source_curve)
+                    is_changed = self.fingerprint != fingerprint \
+                        or self.digest != hash_splines_digest(source_curve, spline_digests, parameters)
+
+                if is_changed:
+                    polylines = [None] * len(source_curve.splines)
+                    # Only the changed splines are rebuilt, unless none did or the parameters changed
+                    if can_update and any(spline_data.digest != spline_digests[spline_data.source_index]
+                                          for spline_data in self.splines):
+                        # Polylines of the unchanged splines are kept from the last sync
+                        if previous_source is not None and len(previous_source[1]) == len(polylines):
+                            polylines = list(previous_source[1])
+                        self.update_splines(curve, source_curve, spline_digests, polylines)
+                    else:
+                        self.rebuild_splines(curve, source_curve, spline_digests, polylines)
+                    # Splines waiting for a background offset have no digest, the curve digest differs until they get it
+                    spline_digests = [spline_data.digest
+                                      for spline_data in sorted(self.splines, key=lambda data: data.source_index)]
+                    self.digest = hash_splines_digest(source_curve, spline_digests, parameters)
+                    self.fingerprint = fingerprint
+                    self.parameters_digest = parameters_digest
+                    source_polylines.set(obj, (self.digest, self.fingerprint), (source_fingerprint, polylines))
+                    write_journal.record(obj, True)
+
+            self.sync_transform()
+
+    def regenerate(self, context):
+        self.curvify(context)
+
+    def offset_again(self, context):
+        obj: bpy.types.Object = self.id_data
+        source = source_polylines.get(obj, (self.digest, self.fingerprint))
+        # Splines copied without offset are not kept as polylines, they are synced from the source curve instead
+        if not self.can_offset_again(source):
+            self.curvify(context)
+            return
+
+        source_fingerprint, polylines = source
+        parameters = self.offset_parameters()
+        curve: bpy.types.Curve = obj.data
+        curve.splines.clear()
+        self.splines.clear()
+        for source_index, (digest, polyline, cyclic) in enumerate(polylines):
+            spline_data = self.splines.add()
+            spline_data.outputs, spline_data.digest = self.make_offset_splines(curve, source_index, digest, polyline,
+                                                                               cyclic)
+            spline_data.source_index = source_index
+        curve.update_tag()
+
+        fingerprint = source_fingerprint.copy()
+        fingerprint.update(parameters)
+        self.digest = hash_splines_digest(curve, [spline_data.digest for spline_data in self.splines], parameters)
+        self.fingerprint = fingerprint.hexdigest()
+        self.parameters_digest = hashlib.sha1(parameters).hexdigest()
+        source_polylines.set(obj, (self.digest, self.fingerprint), source)
+        write_journal.record(obj, True)
+
+    def can_offset_again(self, source):
+        if source is None or self.source_object is None or not self.keep_in_sync or not self.sync_curve:
+            return False
+        if not self.offset_enabled or offset_polyline is None or self.id_data.type != "CURVE":
+            return False
+        polylines = source[1]
+        source_indices = sorted(spline_data.source_index for spline_data in self.splines)
+        return all(polyline is not None for polyline in polylines) and source_indices == list(range(len(polylines)))
+
+    def offset_parameters(self):
+        return array("d", [self.offset_enabled, self.offset, self.resolution, self.round_line_join]).tobytes()
+
+    def can_update_splines(self, curve: bpy.types.Curve, source_curve: bpy.types.Curve):
+        # Curve settings apply to every spline, changing them rebuilds all of them
+        source_indices = sorted(spline_data.source_index for spline_data in self.splines)
+        return source_indices == list(range(len(source_curve.splines))) \
+               and sum(spline_data.outputs for spline_data in self.splines) == len(curve.splines) \
+               and (curve.dimensions, curve.resolution_u, curve.resolution_v) \
+               == (source_curve.dimensions, source_curve.resolution_u, source_curve.resolution_v)
+
+    def rebuild_splines(self, curve: bpy.types.Curve, source_curve: bpy.types.Curve, spline_digests, polylines):
+        # Spline digests which are not known yet are computed while the splines are rebuilt
+        copy_curve_settings(curve, source_curve)
+        self.splines.clear()
+        for source_index, source_spline in enumerate(source_curve.splines):
+            digest = spline_digests[source_index] if spline_digests is not None else None
+            self.add_splines(curve, source_index, source_spline, digest, polylines)
+        curve.update_tag()
+
+    def update_splines(self, curve: bpy.types.Curve, source_curve: bpy.types.Curve, spline_digests, polylines):
+        # Splines generated from one source spline are consecutive, in the order of the spline data collection
+        changed_splines = list()
+        start = 0
+        for position, spline_data in enumerate(self.splines):
+            if spline_data.digest != spline_digests[spline_data.source_index]:
+                changed_splines.append((position, start, spline_data.outputs, spline_data.source_index))
+            start += spline_data.outputs
+
+        for position, start, outputs, _ in reversed(changed_splines):
+            for index in reversed(range(start, start + outputs)):
+                curve.splines.remove(curve.splines[index])
+            self.splines.remove(position)
+
+        for _, _, _, source_index in changed_splines:
+            source_spline = source_curve.splines[source_index]
+            self.add_splines(curve, source_index, source_spline, spline_digests[source_index], polylines)
+        curve.update_tag()
+
+    def add_splines(self, curve: bpy.types.Curve, source_index, source_spline: bpy.types.Spline, digest, polylines):
+        spline_data = self.splines.add()
+        spline_data.outputs, spline_data.digest = self.make_splines(curve, source_index, source_spline, digest,
+                                                                    polylines)
+        spline_data.source_index = source_index
+
+    def make_splines(self, curve: bpy.types.Curve, source_index, source_spline: bpy.types.Spline, digest, polylines):
+        # The spline is read once, to hash it unless its digest is known and to copy or offset it
+        buffers = spline_buffers(source_spline)
+        digest = digest or hash_spline_geometry(source_spline, buffers)
+        if not self.offset_enabled or offset_polyline is None:
+            copy_spline(curve, source_spline, buffers)
+            return 1, digest
+
+        polylines[source_index] = (digest, spline_polyline(source_spline, buffers), source_spline.use_cyclic_u)
+        return self.make_offset_splines(curve, source_index, *polylines[source_index])
+
+    def make_offset_splines(self, curve: bpy.types.Curve, source_index, geometry_digest, polyline, cyclic):
+        key = self.offset_key(geometry_digest)
+        traces = background_traces.pop(key, None)
+        if traces is not None:
+            trace_cache.put(key, traces)
+        else:
+            traces = trace_cache.get(key)
+        if traces is None:
+            args = (polyline, cyclic, self.offset, self.resolution, self.round_line_join)
+            if self.submit_background_offset(key, args, source_index):
+                # The source polyline stands in for its offset until the background job completes, its digest is left
+                # empty for the next sync to offset it again
+                add_poly_spline(curve, polyline, cyclic)
+                return 1, ""
+            traces = offset_polyline(*args)
+            trace_cache.put(key, traces)
+        for trace in traces:
+            add_poly_spline(curve, trace, cyclic)
+        return len(traces), geometry_digest
+
+    def offset_key(self, geometry_digest):
+        return geometry_digest, self.offset, self.resolution, self.round_line_join
+
+    def submit_background_offset(self, key, args, source_index):
+        preferences = get_preferences(bpy.context)
+        if preferences is None or not preferences.background_offset or len(args[0]) < BACKGROUND_OFFSET_POINTS:
+            return False
+        callback = functools.partial(finish_background_offset, self.id_data.name, source_index)
+        return offset_workers.submit(key, args, callback, preferences.background_workers)
+
+    def sync_transform(self, context=None):
+        if self.source_object is not None and self.keep_in_sync:
+            obj: bpy.types.Object = self.id_data
 
+            if self.sync_location:
+                if obj.location != self.source_object.location:
+                    obj.location = self.source_object.location
+                    write_journal.record(obj, False)
             if self.sync_rotation:
                 if obj.rotation_euler != self.source_object.rotation_euler:
                     obj.rotation_euler = self.source_object.rotation_euler
+                    write_journal.record(obj, False)
             if self.sync_scale:
                 if obj.scale != self.source_object.scale:
                     obj.scale = self.source_object.scale
+                    write_journal.record(obj, False)
 
     digest: DigestProperty()
+    fingerprint: FingerprintProperty()
+    parameters_digest: ParametersDigestProperty()
+    splines: CollectionProperty(type=CurvifySplineData)
+    incremental: IncrementalProperty(update=if_unlocked(curvify))
     keep_in_sync: KeepInSyncProperty(update=if_unlocked(curvify))
-    source_object: SourceObjectProperty(update=if_unlocked(curvify))
-    sync_location: SyncLocationProperty(update=if_unlocked(curvify))
+    source_object: SourceObjectProperty(update=reindex(if_unlocked(curvify)))
+    sync_location: SyncLocationProperty(update=if_unlocked(sync_transform))
     sync_curve: SyncCurveProperty(update=if_unlocked(curvify))
-    sync_rotation: SyncRotationProperty(update=if_unlocked(curvify))
-    sync_scale: SyncScaleProperty(update=if_unlocked(curvify))
+    sync_rotation: SyncRotationProperty(update=if_unlocked(sync_transform))
+    sync_scale: SyncScaleProperty(update=if_unlocked(sync_transform))
+
+    offset: OffsetProperty(update=if_unlocked(offset_again))
+    offset_enabled: OffsetEnabledProperty(update=if_unlocked(offset_again))
+    resolution: ResolutionProperty(update=if_unlocked(offset_again))
+    round_line_join: RoundLineJoinProperty(update=if_unlocked(offset_again))
+
+
+def setup_curvify_obj(obj, source_obj, settings):
+    curvify_data: CurvifyData = make_curvify_data(obj)
+    curvify_data.lock()
+    curvify_data.source_object = source_obj
 
-    offset: OffsetProperty(update=if_unlocked(curvify))
-    offset_enabled: OffsetEnabledProperty(update=if_unlocked(curvify))
-    resolution: ResolutionProperty(update=if_unlocked(curvify))
-    round_line_join: RoundLineJoinProperty(update=if_unlocked(curvify))
+    if settings.keep_in_sync != curvify_data.keep_in_sync:
+        curvify_data.keep_in_sync = settings.keep_in_sync
+    if settings.sync_location != curvify_data.sync_location:
+        curvify_data.sync_location = settings.sync_location
+    if settings.sync_curve != curvify_data.sync_curve:
+        curvify_data.sync_curve = settings.sync_curve
+    if settings.sync_rotation != curvify_data.sync_rotation:
+        curvify_data.sync_rotation = settings.sync_rotation
+    if settings.sync_scale != curvify_data.sync_scale:
+        curvify_data.sync_scale = settings.sync_scale
+
+    curvify_data.unlock()
+    return curvify_data
 
 
 class Curvify(bpy.types.Operator):
@@ -225,33 +632,40 @@ class Curvify(bpy.types.Operator):
             return {"CANCELLED"}
 
         selected_obj = context.object
-        set_curvify_source(selected_obj)
 
         curve = bpy.data.curves.new("Curvify", type="CURVE")
         obj = bpy_extras.object_utils.object_data_add(context,
                                                       obdata=curve,
                                                       operator=None,
                                                       name=selected_obj.name + " curvify")
-        curvify_data: CurvifyData = make_curvify_data(obj)
-        curvify_data.lock()
-        curvify_data.source_object = selected_obj
-
-        if self.keep_in_sync != curvify_data.keep_in_sync:
-            curvify_data.keep_in_sync = self.keep_in_sync
-        if self.sync_location != curvify_data.sync_location:
-            curvify_data.sync_location = self.sync_location
-        if self.sync_curve != curvify_data.sync_curve:
-            curvify_data.sync_curve = self.sync_curve
-        if self.sync_rotation != curvify_data.sync_rotation:
-            curvify_data.sync_rotation = self.sync_rotation
-        if self.sync_scale != curvify_data.sync_scale:
-            curvify_data.sync_scale = self.sync_scale
-
-        curvify_data.unlock()
+        curvify_data = setup_curvify_obj(obj, selected_obj, self)
         curvify_data.curvify(context)
         return {"FINISHED"}
 
 
+class CurvifySelected(bpy.types.Operator):
+    bl_idname = "object.curvify_selected"
+    bl_description = "Transform every selected curve into another and keep them in sync, in a single step"
+    bl_label = "Curvify selected"
+    bl_options = {"REGISTER", "UNDO"}
+
+    keep_in_sync: KeepInSyncProperty()
+    sync_location: SyncLocationProperty()
+    sync_curve: SyncCurveProperty()
+    sync_rotation: SyncRotationProperty()
+    sync_scale: SyncScaleProperty()
+
+    def execute(self, context):
+        selected_objs = [obj for obj in context.selected_objects if Curvify.is_curvifiable(obj)]
+        if len(selected_objs) == 0:
+            self.report({"WARNING"}, "No selected object can be curvified")
+            return {"CANCELLED"}
+
+        add_synced_objects(context, self, selected_objs, " curvify",
+                           lambda: bpy.data.curves.new("Curvify", type="CURVE"), setup_curvify_obj)
+        return {"FINISHED"}
+
+
 class CurvifyToggleSource(bpy.types.Operator):
     bl_idname = "object.curvify_toggle_source"
     bl_description = "Toggle source object visibility"
@@ -296,6 +710,8 @@ class CurvifyEditPanel(bpy.types.Panel):
         layout = self.layout
         layout.use_property_split = True
         layout.label(text="Type: %s" % curvify_enum.name, icon="MESH_CUBE")
+        if dependents_index.is_cyclic(obj):
+            layout.label(text="Source cycle, not synced", icon="ERROR")
 
         object_col = layout.column(align=True)
         object_col.enabled = False
@@ -306,11 +722,16 @@ class CurvifyEditPanel(bpy.types.Panel):
         sync_col.enabled = curvify_data.keep_in_sync
         sync_col.prop(curvify_data, "sync_location", text=curvify_props["sync_location"].name)
         sync_col.prop(curvify_data, "sync_curve", text=curvify_props["sync_curve"].name)
+        incremental_col = sync_col.column(align=True)
+        incremental_col.enabled = curvify_data.sync_curve
+        incremental_col.prop(curvify_data, "incremental", text=curvify_props["incremental"].name)
         sync_col.prop(curvify_data, "sync_rotation", text=curvify_props["sync_rotation"].name)
         sync_col.prop(curvify_data, "sync_scale", text=curvify_props["sync_scale"].name)
 
         self.layout.separator()
         layout.prop(curvify_data, "offset_enabled", text=curvify_props["offset_enabled"].name)
+        if offset_polyline is None:
+            layout.label(text="Offset requires NumPy", icon="ERROR")
         offset_col = layout.column(align=True)
         offset_col.prop(curvify_data, "offset", text=curvify_props["offset"].name)
         offset_col.prop(curvify_data, "resolution", text=curvify_props["resolution"].name)
@@ -324,48 +745,52 @@ class CurvifyEditPanel(bpy.types.Panel):
             source_visibility_operator.source_visibility = is_source_visible
 
 
-@bpy.app.handlers.persistent
-def detect_changes(_):
-    processed_list = detect_changes.processed_list
-    context = bpy.context
-    depsgraph = context.evaluated_depsgraph_get()
-    is_depsgraph_update_root = len(processed_list) == 0
-
-    def find_all_curvify_obj_from_source(source_obj):
-        return [other_obj for other_obj in bpy.data.objects
-                if has_curvify_data(other_obj) and get_curvify_data(other_obj).source_object == source_obj]
+def sync_curvify_obj(curvify_obj, context, geometry=True):
+    curvify_data = get_curvify_data(curvify_obj)
+    if geometry:
+        curvify_data.curvify(context)
+    else:
+        curvify_data.sync_transform()
 
-    def update_curvify_obj(curvify_obj, processed_list):
-        if curvify_obj not in processed_list:
-            processed_list.append(curvify_obj)
-            curvify_data = get_curvify_data(curvify_obj)
-            curvify_data.curvify(context)
 
-    for changed_obj in [obj for obj in map(lambda _: _.id.original, depsgraph.updates)]:
-        if is_curvify_source(changed_obj):
-            for curvify_obj in find_all_curvify_obj_from_source(changed_obj):
-                update_curvify_obj(curvify_obj, processed_list)
+def get_curvify_source(curvify_obj):
+    return get_curvify_data(curvify_obj).source_object
 
-        if has_curvify_data(changed_obj):
-            update_curvify_obj(changed_obj, processed_list)
 
-    if is_depsgraph_update_root:
-        detect_changes.processed_list = list()
+@bpy.app.handlers.persistent
+def clear_curvify_state(_):
+    source_polylines.clear()
+    pending_retargets.clear()
+    finished_jobs.clear()
 
 
 def register():
-    detect_changes.processed_list = list()
-
+    append_file_handler(clear_curvify_state)
+    bpy.utils.register_class(CurvifySplineData)
     bpy.utils.register_class(CurvifyData)
     bpy.utils.register_class(Curvify)
+    bpy.utils.register_class(CurvifySelected)
     bpy.utils.register_class(CurvifyToggleSource)
     bpy.utils.register_class(CurvifyEditPanel)
-    bpy.app.handlers.depsgraph_update_post.append(detect_changes)
+    register_sync_handler("CURVIFY", sync_curvify_obj, get_curvify_source)
 
 
 def unregister():
-    bpy.app.handlers.depsgraph_update_post.remove(detect_changes)
+    unregister_sync_handler("CURVIFY")
     bpy.utils.unregister_class(CurvifyEditPanel)
+    bpy.utils.unregister_class(CurvifySelected)
     bpy.utils.unregister_class(Curvify)
     bpy.utils.unregister_class(CurvifyToggleSource)
     bpy.utils.unregister_class(CurvifyData)
+    bpy.utils.unregister_class(CurvifySplineData)
+    remove_file_handler(clear_curvify_state)
+    if bpy.app.timers.is_registered(retarget_pending):
+        bpy.app.timers.unregister(retarget_pending)
+    if bpy.app.timers.is_registered(apply_finished_jobs):
+        bpy.app.timers.unregister(apply_finished_jobs)
+    pending_retargets.clear()
+    finished_jobs.clear()
+    source_polylines.clear()
+    background_traces.clear()
+    if trace_cache is not None:
+        trace_cache.clear()
@@ -0,0 +1,139 @@
+import bpy
+
+from .globals import append_file_handler, get_source_object, remove_file_handler
+
+
+class DependentsIndex:
+    """Reverse index from source objects to the objects kept in sync with them, keyed by object pointer."""
+
+    def __init__(self):
+        self.dependents = dict()
+        self.sources = dict()
+        self.objects_count = -1
+
+    def clear(self):
+        self.dependents.clear()
+        self.sources.clear()
+        self.objects_count = -1
+
+    def rebuild(self):
+        self.dependents.clear()
+        self.sources.clear()
+        for obj in bpy.data.objects:
+            self.add(obj, get_source_object(obj))
+        self.objects_count = len(bpy.data.objects)
+
+    def add(self, dependent, source):
+        self.discard(dependent)
+        if source is not None:
+            dependent_key = dependent.as_pointer()
+            source_key = source.as_pointer()
+            self.sources[dependent_key] = source_key
+            self.dependents.setdefault(source_key, dict())[dependent_key] = dependent
+
+    def discard(self, dependent):
+        dependent_key = dependent.as_pointer()
+        source_key = self.sources.pop(dependent_key, None)
+        if source_key is not None:
+            dependents = self.dependents[source_key]
+            del dependents[dependent_key]
+            if len(dependents) == 0:
+                del self.dependents[source_key]
+
+    def refresh(self):
+        if self.objects_count != len(bpy.data.objects):
+            self.rebuild()
+
+    def get_dependents(self, source_key):
+        dependents = self.dependents.get(source_key, dict())
+        if not all(self.is_dependent(dependent, source_key) for dependent in dependents.values()):
+            self.rebuild()
+            dependents = self.dependents.get(source_key, dict())
+        return dependents
+
+    @staticmethod
+    def is_dependent(dependent, source_key):
+        try:
+            source = get_source_object(dependent)
+            return source is not None and source.as_pointer() == source_key \
+                and bpy.data.objects.get(dependent.name) == dependent
+        except ReferenceError:
+            return False
+
+    def find_dependents(self, source):
+        self.refresh()
+        return list(self.get_dependents(source.as_pointer()).values())
+
+    def find_downstream(self, changed_objs):
+        # Dependents sync the geometry when their source geometry changed, only their transform otherwise
+        self.refresh()
+        downstream = dict()
+        pending = list(changed_objs)
+        while len(pending) > 0:
+            obj, geometry = pending.pop()
+            key = obj.as_pointer()
+            if key in downstream and (downstream[key][1] or not geometry):
+                continue
+            downstream[key] = (obj, geometry)
+            pending.extend((dependent, geometry) for dependent in self.get_dependents(key).values())
+        return downstream
+
+    def sort(self, objs):
+        # Sources come before their dependents. Returns the sorted objects and the ones in or downstream of a cycle.
+        self.refresh()
+        nodes = dict()
+        for obj, geometry in objs:
+            try:
+                nodes[obj.as_pointer()] = (obj, geometry)
+            except ReferenceError:
+                continue
+
+        ordered_keys = [key for key in nodes if self.sources.get(key) not in nodes and not self.is_cyclic_key(key)]
+        ordered = set(ordered_keys)
+        for key in ordered_keys:
+            for dependent_key in self.get_dependents(key):
+                if dependent_key in nodes and dependent_key not in ordered:
+                    ordered.add(dependent_key)
+                    ordered_keys.append(dependent_key)
+        cyclic_objs = [obj for key, (obj, _) in nodes.items() if key not in ordered]
+        return [nodes[key] for key in ordered_keys], cyclic_objs
+
+    def is_cyclic(self, obj):
+        self.refresh()
+        return self.is_cyclic_key(obj.as_pointer())
+
+    def is_cyclic_key(self, key):
+        source_key = self.sources.get(key)
+        for _ in range(len(self.sources)):
+            if source_key is None:
+                return False
+            if source_key == key:
+                return True
+            source_key = self.sources.get(source_key)
+        return True
+
+
+dependents_index = DependentsIndex()
+
+
+def reindex(func):
+    def _reindex(self, context):
+        dependents_index.add(self.id_data, self.source_object)
+        func(self, context)
+
+    return _reindex
+
+
+@bpy.app.handlers.persistent
+def rebuild_dependents_index(_):
+    dependents_index.rebuild()
+
+
+def register():
+    dependents_index.clear()
+    append_file_handler(rebuild_dependents_index, post=True)
+
+
+def unregister():
+    remove_file_handler(rebuild_dependents_index, post=True)
+    dependents_index.clear()
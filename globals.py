@@ -62,3 +62,44 @@ def make_sinegear_data(obj):
     blablacad_data = obj.blablacad_data
     blablacad_data.type = "SINEGEAR"
     return blablacad_data.sinegear_data
+
+
+# Dependencies
+# Types of the objects kept in sync with a source object, with their sync handler and source getter
+sync_handlers = dict()
+
+
+def register_sync_handler(type_name, sync_handler, get_source):
+    sync_handlers[type_name] = (sync_handler, get_source)
+
+
+def unregister_sync_handler(type_name):
+    sync_handlers.pop(type_name, None)
+
+
+def get_sync_handler(obj):
+    handlers = sync_handlers.get(obj.blablacad_data.type)
+    return handlers[0] if handlers is not None else None
+
+
+def get_source_object(obj):
+    handlers = sync_handlers.get(obj.blablacad_data.type)
+    return handlers[1](obj) if handlers is not None else None
+
+
+# Handlers
+def append_file_handler(handler, post=False):
+    # Runs the handler when a file is loaded and on undo and redo, before the change or after it
+    for name in ("load_post", "undo_post", "redo_post") if post else ("load_pre", "undo_pre", "redo_pre"):
+        getattr(bpy.app.handlers, name).append(handler)
+
+
+def remove_file_handler(handler, post=False):
+    for name in ("redo_post", "undo_post", "load_post") if post else ("redo_pre", "undo_pre", "load_pre"):
+        getattr(bpy.app.handlers, name).remove(handler)
+
+
+# Preferences
+def get_preferences(context):
+    addon = context.preferences.addons.get(__package__)
+    return addon.preferences if addon is not None else None
@@ -0,0 +1,40 @@
+import bpy
+
+from .globals import append_file_handler, remove_file_handler
+
+
+class WriteJournal:
+    """Objects written by the add-on since the last depsgraph update handled, not synced again for that update."""
+
+    def __init__(self):
+        self.written_objs = dict()
+
+    def record(self, obj, geometry):
+        key = obj.as_pointer()
+        self.written_objs[key] = geometry or self.written_objs.get(key, False)
+
+    def consume(self):
+        written_objs = self.written_objs
+        self.written_objs = dict()
+        return written_objs
+
+    def clear(self):
+        self.written_objs.clear()
+
+
+write_journal = WriteJournal()
+
+
+@bpy.app.handlers.persistent
+def clear_write_journal(_):
+    write_journal.clear()
+
+
+def register():
+    write_journal.clear()
+    append_file_handler(clear_write_journal)
+
+
+def unregister():
+    remove_file_handler(clear_write_journal)
+    write_journal.clear()
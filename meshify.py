@@ -1,19 +1,27 @@
+import math
+
+import bmesh
 import bpy
 import bpy_extras
 import hashlib
 from array import array
-from bpy.props import BoolProperty, PointerProperty, StringProperty
+from bpy.props import BoolProperty, FloatProperty, PointerProperty, StringProperty
 
-from .globals import has_meshify_data, get_meshify_data, get_meshify_enum, make_meshify_data
-from .utils import Lockable, hash_mesh, if_unlocked
+from .dependencies import dependents_index, reindex
+from .globals import append_file_handler, has_meshify_data, get_meshify_data, get_meshify_enum, make_meshify_data, \
+    register_sync_handler, remove_file_handler, unregister_sync_handler
+from .journal import write_journal
+from .utils import Lockable, ObjectCache, add_synced_objects, fingerprint_mesh, hash_mesh, if_unlocked
 
 
-def is_meshify_source(obj):
-    return "meshify_source" in obj and obj["meshify_source"]
+# Source meshes of the last sync before post-processing, with their fingerprint, hash and materials
+source_meshes = ObjectCache(free=lambda source_mesh: source_mesh[2].free())
 
 
-def set_meshify_source(obj):
-    obj["meshify_source"] = True
+def post_process_digest(source_hash, post_process_parameters):
+    digest_hash = source_hash.copy()
+    digest_hash.update(post_process_parameters)
+    return digest_hash.hexdigest()
 
 
 # noinspection PyPep8Naming
@@ -24,6 +32,14 @@ def DigestProperty():
         description="Mesh digest to detect changes")
 
 
+# noinspection PyPep8Naming
+def FingerprintProperty():
+    return StringProperty(
+        name="Mesh fingerprint",
+        default="",
+        description="Cheap mesh fingerprint to detect changes before computing the digest")
+
+
 # noinspection PyPep8Naming
 def KeepInSyncProperty(update=None):
     return BoolProperty(
@@ -51,6 +67,20 @@ def RemoveDoubleProperty(update=None):
         update=update)
 
 
+# noinspection PyPep8Naming
+def WeldThresholdProperty(update=None):
+    return FloatProperty(
+        name="Merge distance",
+        default=0.002,
+        description="Maximum distance between vertices to merge when removing doubles",
+        min=0.0,
+        soft_max=1.0,
+        step=0.1,
+        precision=4,
+        unit="LENGTH",
+        update=update)
+
+
 # noinspection PyPep8Naming
 def SourceObjectProperty(update=None):
     return PointerProperty(
@@ -101,61 +131,139 @@ class MeshifyData(bpy.types.PropertyGroup, Lockable):
     def meshify(self, context):
         obj: bpy.types.Object = self.id_data
         if self.source_object is not None and self.keep_in_sync:
-            if self.sync_location:
-                if obj.location != self.source_object.location:
-                    obj.location = self.source_object.location
-
             if self.sync_mesh:
                 depsgraph = context.evaluated_depsgraph_get()
                 evaluated_object = self.source_object.evaluated_get(depsgraph)
-                evaluated_mesh = bpy.data.meshes.new_from_object(evaluated_object)
-
-                source_hash = hashlib.sha1()
-                hash_mesh(source_hash, evaluated_mesh)
-                source_hash.update(array("l", [self.make_fan_face_enabled, self.sync_location, self.sync_mesh, self.sync_rotation,
-                                              self.sync_scale]))
-                source_digest = source_hash.hexdigest()
-                if self.digest != source_digest:
-                    self.digest = source_digest
-
-                    obj.data = evaluated_mesh
-                    if self.make_fan_face_enabled:
-                        previous_selection = bpy.context.view_layer.objects.active
-                        bpy.context.view_layer.objects.active = obj
-                        bpy.ops.object.mode_set(mode="EDIT")
-                        bpy.ops.mesh.select_all(action="SELECT")
-                        bpy.ops.mesh.edge_face_add()
-                        bpy.ops.mesh.poke()
-                        bpy.ops.mesh.dissolve_limited()
-                        bpy.ops.object.mode_set(mode="OBJECT")
-                        bpy.context.view_layer.objects.active = previous_selection
-
-                    if self.remove_doubles:
-                        previous_selection = bpy.context.view_layer.objects.active
-                        bpy.context.view_layer.objects.active = self.id_data
-                        bpy.ops.object.mode_set(mode="EDIT")
-                        bpy.ops.mesh.select_all(action="SELECT")
-                        bpy.ops.mesh.remove_doubles(threshold=0.002)
-                        bpy.ops.object.mode_set(mode="OBJECT")
-                        bpy.context.view_layer.objects.active = previous_selection
+                evaluated_mesh = evaluated_object.to_mesh()
+                try:
+                    post_process_parameters = self.post_process_parameters()
+                    source_fingerprint = hashlib.sha1()
+                    fingerprint_mesh(source_fingerprint, evaluated_mesh)
+                    fingerprint = source_fingerprint.copy()
+                    fingerprint.update(post_process_parameters)
+                    fingerprint = fingerprint.hexdigest()
+
+                    # A differing fingerprint means the source definitely changed, the source is then hashed with the
+                    # rebuild so that the next sync compares against its digest instead of rebuilding again
+                    source_hash = None
+                    if self.fingerprint == fingerprint:
+                        source_hash = hashlib.sha1()
+                        hash_mesh(source_hash, evaluated_mesh)
+                        is_changed = self.digest != post_process_digest(source_hash, post_process_parameters)
+                    else:
+                        is_changed = True
+
+                    if is_changed:
+                        # The source is kept before post-processing, to post-process it again when parameters change
+                        bm = bmesh.new()
+                        bm.from_mesh(evaluated_mesh)
+                        self.write_mesh(obj.data, bm.copy(), evaluated_mesh.materials[:])
+                        if source_hash is None:
+                            source_hash = hashlib.sha1()
+                            hash_mesh(source_hash, evaluated_mesh)
+                        self.digest = post_process_digest(source_hash, post_process_parameters)
+                        self.fingerprint = fingerprint
+                        source_meshes.set(obj, (self.digest, self.fingerprint),
+                                          (source_fingerprint, source_hash, bm, evaluated_mesh.materials[:]))
+                        write_journal.record(obj, True)
+                finally:
+                    evaluated_object.to_mesh_clear()
+
+            self.sync_transform()
+
+    def regenerate(self, context):
+        self.meshify(context)
+
+    def post_process_again(self, context):
+        obj: bpy.types.Object = self.id_data
+        source_mesh = source_meshes.get(obj, (self.digest, self.fingerprint))
+        if source_mesh is None or self.source_object is None or not self.keep_in_sync or not self.sync_mesh:
+            self.meshify(context)
+            return
+
+        source_fingerprint, source_hash, bm, materials = source_mesh
+        post_process_parameters = self.post_process_parameters()
+        fingerprint = source_fingerprint.copy()
+        fingerprint.update(post_process_parameters)
+        self.fingerprint = fingerprint.hexdigest()
+        self.digest = post_process_digest(source_hash, post_process_parameters)
+        self.write_mesh(obj.data, bm.copy(), materials)
+        source_meshes.set(obj, (self.digest, self.fingerprint), source_mesh)
+        write_journal.record(obj, True)
+
+    def post_process_parameters(self):
+        return array("l", [self.make_fan_face_enabled, self.remove_doubles]).tobytes() \
+               + array("d", [self.weld_threshold]).tobytes()
+
+    def sync_transform(self, context=None):
+        obj: bpy.types.Object = self.id_data
+        if self.source_object is not None and self.keep_in_sync:
+            if self.sync_location:
+                if obj.location != self.source_object.location:
+                    obj.location = self.source_object.location
+                    write_journal.record(obj, False)
 
             if self.sync_rotation:
                 if obj.rotation_euler != self.source_object.rotation_euler:
                     obj.rotation_euler = self.source_object.rotation_euler
+                    write_journal.record(obj, False)
 
             if self.sync_scale:
                 if obj.scale != self.source_object.scale:
                     obj.scale = self.source_object.scale
+                    write_journal.record(obj, False)
+
+    def write_mesh(self, mesh: bpy.types.Mesh, bm: bmesh.types.BMesh, materials):
+        self.post_process(bm)
+        bm.to_mesh(mesh)
+        bm.free()
+
+        if mesh.materials[:] != materials:
+            mesh.materials.clear()
+            for material in materials:
+                mesh.materials.append(material)
+        mesh.update()
+
+    def post_process(self, bm: bmesh.types.BMesh):
+        if self.make_fan_face_enabled:
+            bmesh.ops.contextual_create(bm, geom=bm.verts[:] + bm.edges[:])
+            bmesh.ops.poke(bm, faces=bm.faces[:])
+            bmesh.ops.dissolve_limited(bm, angle_limit=math.radians(5.0), verts=bm.verts[:], edges=bm.edges[:])
+
+        if self.remove_doubles:
+            bmesh.ops.remove_doubles(bm, verts=bm.verts[:], dist=self.weld_threshold)
 
     digest: DigestProperty()
+    fingerprint: FingerprintProperty()
     keep_in_sync: KeepInSyncProperty(update=if_unlocked(meshify))
-    make_fan_face_enabled: MakeFanFaceEnabledProperty(update=if_unlocked(meshify))
-    remove_doubles: RemoveDoubleProperty(update=if_unlocked(meshify))
-    source_object: SourceObjectProperty(update=if_unlocked(meshify))
-    sync_location: SyncLocationProperty(update=if_unlocked(meshify))
+    make_fan_face_enabled: MakeFanFaceEnabledProperty(update=if_unlocked(post_process_again))
+    remove_doubles: RemoveDoubleProperty(update=if_unlocked(post_process_again))
+    source_object: SourceObjectProperty(update=reindex(if_unlocked(meshify)))
+    sync_location: SyncLocationProperty(update=if_unlocked(sync_transform))
     sync_mesh: SyncMeshProperty(update=if_unlocked(meshify))
-    sync_rotation: SyncRotationProperty(update=if_unlocked(meshify))
-    sync_scale: SyncScaleProperty(update=if_unlocked(meshify))
+    sync_rotation: SyncRotationProperty(update=if_unlocked(sync_transform))
+    sync_scale: SyncScaleProperty(update=if_unlocked(sync_transform))
+    weld_threshold: WeldThresholdProperty(update=if_unlocked(post_process_again))
+
+
+def setup_meshify_obj(obj, source_obj, settings):
+    meshify_data: MeshifyData = make_meshify_data(obj)
+    meshify_data.lock()
+    meshify_data.source_object = source_obj
+
+    if settings.keep_in_sync != meshify_data.keep_in_sync:
+        meshify_data.keep_in_sync = settings.keep_in_sync
+    if settings.sync_location != meshify_data.sync_location:
+        meshify_data.sync_location = settings.sync_location
+    if settings.sync_mesh != meshify_data.sync_mesh:
+        meshify_data.sync_mesh = settings.sync_mesh
+    if settings.sync_rotation != meshify_data.sync_rotation:
+        meshify_data.sync_rotation = settings.sync_rotation
+    if settings.sync_scale != meshify_data.sync_scale:
+        meshify_data.sync_scale = settings.sync_scale
+
+    meshify_data.unlock()
+    return meshify_data
 
 
 class Meshify(bpy.types.Operator):
@@ -184,33 +292,40 @@ class Meshify(bpy.types.Operator):
             return {"CANCELLED"}
 
         selected_obj = context.object
-        set_meshify_source(selected_obj)
 
         mesh = bpy.data.meshes.new("Meshify")
         obj = bpy_extras.object_utils.object_data_add(context,
                                                       obdata=mesh,
                                                       operator=None,
                                                       name=selected_obj.name + " meshify")
-        meshify_data: MeshifyData = make_meshify_data(obj)
-        meshify_data.lock()
-        meshify_data.source_object = selected_obj
-
-        if self.keep_in_sync != meshify_data.keep_in_sync:
-            meshify_data.keep_in_sync = self.keep_in_sync
-        if self.sync_location != meshify_data.sync_location:
-            meshify_data.sync_location = self.sync_location
-        if self.sync_mesh != meshify_data.sync_mesh:
-            meshify_data.sync_mesh = self.sync_mesh
-        if self.sync_rotation != meshify_data.sync_rotation:
-            meshify_data.sync_rotation = self.sync_rotation
-        if self.sync_scale != meshify_data.sync_scale:
-            meshify_data.sync_scale = self.sync_scale
-
-        meshify_data.unlock()
+        meshify_data = setup_meshify_obj(obj, selected_obj, self)
         meshify_data.meshify(context)
         return {"FINISHED"}
 
 
+class MeshifySelected(bpy.types.Operator):
+    bl_idname = "object.meshify_selected"
+    bl_description = "Turn every selected object into a mesh and keep them in sync, in a single step"
+    bl_label = "Meshify selected"
+    bl_options = {"REGISTER", "UNDO"}
+
+    keep_in_sync: KeepInSyncProperty()
+    sync_location: SyncLocationProperty()
+    sync_mesh: SyncMeshProperty()
+    sync_rotation: SyncRotationProperty()
+    sync_scale: SyncScaleProperty()
+
+    def execute(self, context):
+        selected_objs = [obj for obj in context.selected_objects if Meshify.is_meshifiable(obj)]
+        if len(selected_objs) == 0:
+            self.report({"WARNING"}, "No selected object can be meshified")
+            return {"CANCELLED"}
+
+        add_synced_objects(context, self, selected_objs, " meshify", lambda: bpy.data.meshes.new("Meshify"),
+                           setup_meshify_obj)
+        return {"FINISHED"}
+
+
 class MeshifyToggleSource(bpy.types.Operator):
     bl_idname = "object.meshify_toggle_source"
     bl_description = "Toggle source object visibility"
@@ -255,6 +370,8 @@ class MeshifyEditPanel(bpy.types.Panel):
         layout = self.layout
         layout.use_property_split = True
         layout.label(text="Type: %s" % meshify_enum.name, icon="MESH_CUBE")
+        if dependents_index.is_cyclic(obj):
+            layout.label(text="Source cycle, not synced", icon="ERROR")
 
         object_col = layout.column(align=True)
         object_col.enabled = False
@@ -269,6 +386,9 @@ class MeshifyEditPanel(bpy.types.Panel):
         sync_col.prop(meshify_data, "sync_scale", text=meshify_props["sync_scale"].name)
         sync_col.separator()
         sync_col.prop(meshify_data, "remove_doubles", text=meshify_props["remove_doubles"].name)
+        weld_col = sync_col.column(align=True)
+        weld_col.enabled = meshify_data.remove_doubles
+        weld_col.prop(meshify_data, "weld_threshold", text=meshify_props["weld_threshold"].name)
 
         if meshify_data.source_object is not None:
             if meshify_data.source_object.type == "CURVE":
@@ -281,48 +401,39 @@ class MeshifyEditPanel(bpy.types.Panel):
             source_visibility_operator.source_visibility = is_source_visible
 
 
-@bpy.app.handlers.persistent
-def detect_changes(_):
-    processed_list = detect_changes.processed_list
-    context = bpy.context
-    depsgraph = context.evaluated_depsgraph_get()
-    is_depsgraph_update_root = len(processed_list) == 0
-
-    def find_all_meshify_obj_from_source(source_obj):
-        return [other_obj for other_obj in bpy.data.objects
-                if has_meshify_data(other_obj) and get_meshify_data(other_obj).source_object == source_obj]
+def sync_meshify_obj(meshify_obj, context, geometry=True):
+    meshify_data = get_meshify_data(meshify_obj)
+    if geometry:
+        meshify_data.meshify(context)
+    else:
+        meshify_data.sync_transform()
 
-    def update_meshify_obj(meshify_obj, processed_list):
-        if meshify_obj not in processed_list:
-            processed_list.append(meshify_obj)
-            meshify_data = get_meshify_data(meshify_obj)
-            meshify_data.meshify(context)
 
-    for changed_obj in [obj for obj in map(lambda _: _.id.original, depsgraph.updates)]:
-        if is_meshify_source(changed_obj):
-            for meshify_obj in find_all_meshify_obj_from_source(changed_obj):
-                update_meshify_obj(meshify_obj, processed_list)
+def get_meshify_source(meshify_obj):
+    return get_meshify_data(meshify_obj).source_object
 
-        if has_meshify_data(changed_obj):
-            update_meshify_obj(changed_obj, processed_list)
 
-    if is_depsgraph_update_root:
-        detect_changes.processed_list = list()
+@bpy.app.handlers.persistent
+def clear_source_meshes(_):
+    source_meshes.clear()
 
 
 def register():
-    detect_changes.processed_list = list()
-
+    append_file_handler(clear_source_meshes)
     bpy.utils.register_class(MeshifyData)
     bpy.utils.register_class(Meshify)
+    bpy.utils.register_class(MeshifySelected)
     bpy.utils.register_class(MeshifyToggleSource)
     bpy.utils.register_class(MeshifyEditPanel)
-    bpy.app.handlers.depsgraph_update_post.append(detect_changes)
+    register_sync_handler("MESHIFY", sync_meshify_obj, get_meshify_source)
 
 
 def unregister():
-    bpy.app.handlers.depsgraph_update_post.remove(detect_changes)
+    unregister_sync_handler("MESHIFY")
     bpy.utils.unregister_class(MeshifyEditPanel)
+    bpy.utils.unregister_class(MeshifySelected)
     bpy.utils.unregister_class(Meshify)
     bpy.utils.unregister_class(MeshifyToggleSource)
     bpy.utils.unregister_class(MeshifyData)
+    remove_file_handler(clear_source_meshes)
+    source_meshes.clear()
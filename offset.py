@@ -0,0 +1,430 @@
+import math
+from collections import OrderedDict
+
+import numpy
+
+BEZIER_SAMPLES = 128
+MITER_LIMIT = 4.0
+EPSILON = 1e-9
+
+
+def bezier_polyline(co, handle_left, handle_right, cyclic, samples=BEZIER_SAMPLES):
+    """Sample the segments of a bezier spline given as (n, 3) arrays of control points and handles."""
+    if len(co) < 2:
+        return numpy.array(co, dtype=numpy.float64).reshape(-1, 3)
+
+    end = numpy.arange(1, len(co) + 1) % len(co) if cyclic else numpy.arange(1, len(co))
+    start = numpy.arange(len(end))
+    p0, p1, p2, p3 = co[start], handle_right[start], handle_left[end], co[end]
+
+    t = (numpy.arange(samples) / samples)[:, None, None]
+    s = 1.0 - t
+    points = s ** 3 * p0 + 3.0 * s ** 2 * t * p1 + 3.0 * s * t ** 2 * p2 + t ** 3 * p3
+    points = points.transpose(1, 0, 2).reshape(-1, 3)
+    if not cyclic:
+        points = numpy.vstack((points, co[-1:]))
+    return points.astype(numpy.float64)
+
+
+def offset_polyline(points, cyclic, offset, resolution, round_line_join):
+    """Offset a polyline in the XY plane, positive offsets moving to the left of the travel direction.
+
+    Convex corners are joined by circle arcs split in steps of at most ``resolution`` radians when
+    ``round_line_join`` is set, and by miters otherwise or when they turn less than ``resolution``. The loops
+    created at concave corners or by offsets wider than the curve features are cut away. Returns the list of (n, 3)
+    traces, Z coordinates being kept from the source vertices.
+    """
+    points = _remove_duplicates(numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3), cyclic)
+    if len(points) < 2:
+        return list()
+    if offset == 0.0:
+        return [points]
+
+    trace, vertex, depth = _offset_vertices(points, cyclic, offset, resolution, round_line_join)
+    if cyclic:
+        traces = _split(trace, vertex, points, True, abs(offset), depth, numpy.sign(_signed_area(points)))
+        return _far_enough(traces, points, abs(offset) * depth)
+    else:
+        return _split(trace, vertex, points, False, abs(offset), depth)
+
+
+class TraceCache:
+    """Least recently used cache of offset traces, bounded by a number of entries and by the memory of the traces."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        traces = self.entries.get(key)
+        if traces is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return traces
+
+    def put(self, key, traces):
+        for trace in traces:
+            # Cached traces are shared between every object using them
+            trace.setflags(write=False)
+        self.discard(key)
+        self.entries[key] = traces
+        self.bytes += sum(trace.nbytes for trace in traces)
+        self.evict()
+
+    def discard(self, key):
+        traces = self.entries.pop(key, None)
+        if traces is not None:
+            self.bytes -= sum(trace.nbytes for trace in traces)
+
+    def resize(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, traces = self.entries.popitem(last=False)
+            self.bytes -= sum(trace.nbytes for trace in traces)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+def _remove_duplicates(points, cyclic):
+    if len(points) < 2:
+        return points
+    keep = numpy.any(numpy.abs(numpy.diff(points[:, :2], axis=0)) > EPSILON, axis=1)
+    points = points[numpy.concatenate(([True], keep))]
+    if cyclic and len(points) > 1 and numpy.all(numpy.abs(points[-1, :2] - points[0, :2]) <= EPSILON):
+        points = points[:-1]
+    return points
+
+
+def _offset_vertices(points, cyclic, offset, resolution, round_line_join):
+    count = len(points)
+    following = numpy.roll(points, -1, axis=0) if cyclic else points[1:]
+    segments = (following - points[:len(following)])[:, :2]
+    lengths = numpy.linalg.norm(segments, axis=1)
+    tangents = segments / lengths[:, None]
+    # Unit vectors pointing from the source vertices to the offset side of each segment
+    sides = numpy.stack((-tangents[:, 1], tangents[:, 0]), axis=1) * math.copysign(1.0, offset)
+
+    if cyclic:
+        side_before = numpy.roll(sides, 1, axis=0)
+        side_after = sides
+        length_before = numpy.roll(lengths, 1)
+        length_after = lengths
+    else:
+        side_before = numpy.vstack((sides[:1], sides))
+        side_after = numpy.vstack((sides, sides[-1:]))
+        length_before = numpy.append(lengths[:1], lengths)
+        length_after = numpy.append(lengths, lengths[-1:])
+
+    # Signed turning angle of the polyline at each vertex, the same as between the offset sides
+    cross = side_before[:, 0] * side_after[:, 1] - side_before[:, 1] * side_after[:, 0]
+    dot = numpy.einsum("ij,ij->i", side_before, side_after)
+    sweep = numpy.arctan2(cross, dot)
+
+    straight = numpy.abs(sweep) < EPSILON
+    convex = ~straight & (sweep * offset < 0.0)
+    concave = ~straight & ~convex
+    counts = numpy.ones(count, dtype=numpy.int64)
+    half_sweep = numpy.abs(sweep[convex]) / 2.0
+    beyond_miter_limit = numpy.cos(half_sweep) * MITER_LIMIT < 1.0
+    if round_line_join:
+        # Corners turning less than the resolution are joined by a miter, like the straight parts between arc steps
+        arc_counts = numpy.ceil(numpy.abs(sweep[convex]) / resolution).astype(numpy.int64) + 1
+        counts[convex] = numpy.where((numpy.abs(sweep[convex]) < resolution) & ~beyond_miter_limit, 1, arc_counts)
+    else:
+        counts[convex] = numpy.where(beyond_miter_limit, 2, 1)
+    # Concave miters are kept when they stay on both segments, otherwise the two offset segments cross and the loop
+    # is cut away afterwards
+    miter_shift = abs(offset) * numpy.tan(numpy.abs(sweep) / 2.0)
+    counts[concave & (miter_shift > numpy.minimum(length_before, length_after))] = 2
+
+    vertex = numpy.repeat(numpy.arange(count), counts)
+    step = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    single = counts[vertex] == 1
+    # Single points are miters, at half the sweep and pushed out so that both offset lines go through them
+    angle = numpy.where(single, sweep[vertex] / 2.0, sweep[vertex] * step / numpy.maximum(counts[vertex] - 1, 1))
+    distance = numpy.where(single, abs(offset) / numpy.cos(angle), abs(offset))
+
+    side = side_before[vertex]
+    cos, sin = numpy.cos(angle), numpy.sin(angle)
+    trace = points[vertex].copy()
+    trace[:, 0] += (side[:, 0] * cos - side[:, 1] * sin) * distance
+    trace[:, 1] += (side[:, 0] * sin + side[:, 1] * cos) * distance
+    # The straight steps of arcs and bevels come closer to the corners than the offset, down to this ratio of it
+    steps = numpy.abs(sweep[convex]) / numpy.maximum(counts[convex] - 1, 1)
+    depth = float(numpy.cos(steps[counts[convex] > 1] / 2.0).min(initial=1.0))
+    return trace, vertex, depth
+
+
+def _signed_area(points):
+    x, y = points[:, 0], points[:, 1]
+    return (numpy.dot(x, numpy.roll(y, -1)) - numpy.dot(y, numpy.roll(x, -1))) / 2.0
+
+
+def _far_enough(traces, points, distance, samples=16):
+    # Pieces mostly closer to the source than the offset distance come from offsets wider than the curve features
+    if len(traces) == 0:
+        return traces
+
+    samples = [numpy.unique(numpy.linspace(1, len(trace) - 1, min(samples, len(trace) - 1)).astype(numpy.int64))
+               for trace in traces]
+    queries = numpy.vstack([trace[indices, :2] for trace, indices in zip(traces, samples)])
+    too_close = _closer_than(queries, points[:, :2], numpy.roll(points, -1, axis=0)[:, :2], distance * (1.0 - 1e-4))
+
+    valid_traces = list()
+    start = 0
+    for trace, indices in zip(traces, samples):
+        if numpy.count_nonzero(too_close[start:start + len(indices)]) * 2 <= len(indices):
+            valid_traces.append(trace)
+        start += len(indices)
+    return valid_traces
+
+
+def _split(trace, vertex, points, cyclic, distance, depth, orientation=0.0):
+    """Cut the trace at its crossings and link the pieces farther than the distance from the source into loops.
+
+    The straight steps of arcs come closer to the source than the distance, down to its depth ratio, pieces are only
+    left out of the crossings when closer than that. Closed traces return the loops running along the orientation,
+    the loops running against the source are inverted. Open traces keep their end points and return the single part
+    from their first to their last point.
+    """
+    distance = distance * (1.0 - 1e-4)
+    kept = _kept_segments(trace, vertex, points, cyclic, distance * depth)
+    segments, crossings, crossing_points = _crossings(trace, kept, cyclic)
+    count = len(segments)
+    if count == 0:
+        return [trace] if not cyclic or _is_oriented(len(trace), _signed_area(trace), orientation) else list()
+
+    # Piece k runs from meeting k through the vertices of the following segments to meeting k + 1. Open traces have
+    # an extra piece from their start, the last piece running to their end
+    meetings = numpy.argsort(crossings, kind="stable")
+    partners = numpy.empty(count, dtype=numpy.int64)
+    partners[meetings] = meetings[numpy.arange(count) ^ 1]
+    firsts = segments + 1
+    lasts = numpy.append(segments[1:], segments[0] + len(trace) if cyclic else len(trace) - 1)
+    starts = crossing_points[crossings]
+    ends = numpy.roll(starts, -1, axis=0)
+    sources = segments
+    if cyclic:
+        trace, vertex = numpy.vstack((trace, trace)), numpy.concatenate((vertex, vertex))
+    else:
+        firsts, lasts, sources = numpy.append(firsts, 0), numpy.append(lasts, segments[0]), numpy.append(segments, 0)
+        ends[-1] = trace[-1]
+        starts, ends = numpy.vstack((starts, trace[:1])), numpy.vstack((ends, starts[:1]))
+
+    # Pieces are sampled at their middle vertex, or halfway between their meetings when they have none
+    has_vertices = firsts <= lasts
+    middles = (firsts + lasts) // 2
+    samples = numpy.where(has_vertices[:, None], trace[middles, :2], (starts[:, :2] + ends[:, :2]) / 2.0)
+    sample_vertices = numpy.where(has_vertices, vertex[middles], vertex[sources])
+    valid = _far_from_source(samples, sample_vertices, points, cyclic, distance)
+
+    # At the end of a piece, the trace goes straight on when only the piece leaving from the same segment is valid and
+    # turns onto the other segment of the crossing otherwise. Loops start from valid pieces, the pieces only farther
+    # than the depth of the arcs are followed but never start one
+    turns = numpy.append(partners[1:], partners[0])
+    straights = (numpy.arange(count) + 1) % count
+    if not cyclic:
+        turns, straights = numpy.append(turns, partners[0]), numpy.append(straights, 0)
+    turns, straights, valid = turns.tolist(), straights.tolist(), valid.tolist()
+    visited = [False] * len(firsts)
+    loops = list()
+    for first in ([count] if not cyclic else list()) + list(range(count)):
+        if visited[first] or not valid[first] and cyclic:
+            continue
+        loop = list()
+        piece = first
+        while not visited[piece]:
+            visited[piece] = True
+            loop.append(piece)
+            if piece == count - 1 and not cyclic:
+                break
+            piece = straights[piece] if valid[straights[piece]] and not valid[turns[piece]] else turns[piece]
+        loops.append(loop)
+        if not cyclic:
+            break
+
+    traces = list()
+    for loop in loops:
+        parts = list()
+        for piece in loop:
+            if piece < count:
+                parts.append(starts[piece:piece + 1])
+            parts.append(trace[firsts[piece]:lasts[piece] + 1])
+        loop_trace = numpy.vstack(parts)
+        if not cyclic or _is_oriented(len(loop_trace), _signed_area(loop_trace), orientation):
+            traces.append(loop_trace)
+    return traces
+
+
+def _is_oriented(size, area, orientation):
+    return size > 2 and abs(area) > EPSILON and (orientation == 0 or numpy.sign(area) == orientation)
+
+
+def _kept_segments(trace, vertex, points, cyclic, distance, window=8):
+    """Return for each segment of the trace whether part of it may be farther than the distance from the source.
+
+    A segment with both ends closer than the distance to the same source segment is entirely within that distance,
+    the source segments around the vertex it comes from are checked.
+    """
+    ends = numpy.roll(trace, -1, axis=0) if cyclic else trace[1:]
+    starts = trace[:len(ends)]
+    remaining = numpy.arange(len(ends))
+    for shift in _shifts(window):
+        source_starts, source_ends = _source_segments(vertex[remaining], points, cyclic, shift)
+        covered = (_segment_distances(starts[remaining, :2], source_starts, source_ends) < distance) \
+            & (_segment_distances(ends[remaining, :2], source_starts, source_ends) < distance)
+        remaining = remaining[~covered]
+    kept = numpy.zeros(len(ends), dtype=bool)
+    kept[remaining] = True
+    return kept
+
+
+def _far_from_source(queries, vertex, points, cyclic, distance, window=32):
+    # The source segments around the vertex the queries come from rule out most of them before the others are searched
+    remaining = numpy.arange(len(queries))
+    for shift in _shifts(window):
+        source_starts, source_ends = _source_segments(vertex[remaining], points, cyclic, shift)
+        remaining = remaining[_segment_distances(queries[remaining], source_starts, source_ends) >= distance]
+    following = numpy.roll(points, -1, axis=0) if cyclic else points[1:]
+    far = numpy.zeros(len(queries), dtype=bool)
+    far[remaining] = ~_closer_than(queries[remaining], points[:len(following), :2], following[:, :2], distance)
+    return far
+
+
+def _shifts(window):
+    # Steps away from a source vertex, closest first
+    return [0] + [shift for step in range(1, window + 1) for shift in (-step, step)]
+
+
+def _source_segments(vertex, points, cyclic, shift):
+    # Start and end points of the source segments a number of steps away from each vertex
+    following = numpy.roll(points, -1, axis=0) if cyclic else points[1:]
+    source = vertex + shift
+    source = source % len(following) if cyclic else numpy.clip(source, 0, len(following) - 1)
+    return points[source, :2], following[source, :2]
+
+
+def _crossings(trace, kept, cyclic):
+    """Return the segment and crossing index of both meetings of each crossing between non adjacent kept segments, in
+    their order along the trace, and the crossing points.
+    """
+    empty = numpy.zeros(0, dtype=numpy.int64)
+    indices = numpy.flatnonzero(kept)
+    if len(trace) < 4 or len(indices) < 3:
+        return empty, empty, trace[:0]
+
+    following = numpy.roll(trace, -1, axis=0) if cyclic else trace[1:]
+    starts = trace[:len(following)]
+    i, j = _candidate_pairs(starts[indices, :2], following[indices, :2], indices)
+    adjacent = cyclic & (i == 0) & (j == len(starts) - 1)
+    i, j = i[~adjacent], j[~adjacent]
+
+    p, r = starts[i, :2], following[i, :2] - starts[i, :2]
+    q, s = starts[j, :2], following[j, :2] - starts[j, :2]
+    denominator = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+    lengths = numpy.linalg.norm(r, axis=1) * numpy.linalg.norm(s, axis=1)
+    parallel = numpy.abs(denominator) < EPSILON * lengths
+    denominator[parallel] = 1.0
+    qp = q - p
+    t = (qp[:, 0] * s[:, 1] - qp[:, 1] * s[:, 0]) / denominator
+    u = (qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) / denominator
+    crossing = ~parallel & (t >= 0.0) & (t < 1.0) & (u >= 0.0) & (u < 1.0)
+
+    i, j, t, u = i[crossing], j[crossing], t[crossing], u[crossing]
+    points = starts[i] + (following[i] - starts[i]) * t[:, None]
+    # Meetings 2 * c and 2 * c + 1 are the two of crossing c
+    segments = numpy.stack((i, j), axis=1).ravel()
+    order = numpy.lexsort((numpy.stack((t, u), axis=1).ravel(), segments))
+    return segments[order], order // 2, points
+
+
+def _candidate_pairs(starts, ends, indices):
+    # Uniform grid broad phase, segments sharing a cell are candidates, cells are about one segment wide
+    low = numpy.minimum(starts, ends)
+    high = numpy.maximum(starts, ends)
+    cell = max(float(numpy.max(high - low, axis=1).mean()), EPSILON)
+    first = numpy.floor((low - low.min(axis=0)) / cell).astype(numpy.int64)
+    last = numpy.floor((high - low.min(axis=0)) / cell).astype(numpy.int64)
+
+    widths = last[:, 0] - first[:, 0] + 1
+    counts = widths * (last[:, 1] - first[:, 1] + 1)
+    segment = numpy.repeat(numpy.arange(len(starts)), counts)
+    local = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    cell_x = first[segment, 0] + local % widths[segment]
+    cell_y = first[segment, 1] + local // widths[segment]
+    keys = cell_x * (int(last[:, 1].max()) + 1) + cell_y
+
+    order = numpy.argsort(keys, kind="stable")
+    keys, segment, cell_x, cell_y = keys[order], segment[order], cell_x[order], cell_y[order]
+    boundaries = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(keys)) + 1, [len(keys)]))
+    group_ends = numpy.repeat(boundaries[1:], numpy.diff(boundaries))
+    partners = group_ends - numpy.arange(len(keys)) - 1
+
+    position = numpy.repeat(numpy.arange(len(keys)), partners)
+    other = position + 1 + numpy.arange(partners.sum()) - numpy.repeat(numpy.cumsum(partners) - partners, partners)
+    a, b = segment[position], segment[other]
+    # Pairs sharing several cells are only kept in the first cell of both, where their bounds start to overlap
+    first_cell = (numpy.maximum(first[a, 0], first[b, 0]) == cell_x[position]) \
+        & (numpy.maximum(first[a, 1], first[b, 1]) == cell_y[position])
+    a, b = indices[a[first_cell]], indices[b[first_cell]]
+    i, j = numpy.minimum(a, b), numpy.maximum(a, b)
+    distant = j - i > 1
+    return i[distant], j[distant]
+
+
+def _closer_than(queries, starts, ends, distance):
+    """Return for each query point whether a segment passes closer than the distance, using a grid of that size."""
+    origin = numpy.minimum(starts, ends).min(axis=0)
+    first = numpy.floor((numpy.minimum(starts, ends) - origin) / distance).astype(numpy.int64)
+    last = numpy.floor((numpy.maximum(starts, ends) - origin) / distance).astype(numpy.int64)
+    columns = int(last[:, 1].max()) + 3
+
+    widths = last[:, 0] - first[:, 0] + 1
+    counts = widths * (last[:, 1] - first[:, 1] + 1)
+    segment = numpy.repeat(numpy.arange(len(starts)), counts)
+    local = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    keys = (first[segment, 0] + local % widths[segment] + 1) * columns \
+        + first[segment, 1] + local // widths[segment] + 1
+    order = numpy.argsort(keys, kind="stable")
+    keys, segment = keys[order], segment[order]
+
+    closer = numpy.zeros(len(queries), dtype=bool)
+    query_cells = numpy.floor((queries - origin) / distance).astype(numpy.int64)
+    for offset_x in (-1, 0, 1):
+        for offset_y in (-1, 0, 1):
+            cell_x = query_cells[:, 0] + offset_x + 1
+            cell_y = query_cells[:, 1] + offset_y + 1
+            inside = (cell_x >= 0) & (cell_y >= 0) & (cell_y < columns)
+            query_keys = numpy.where(inside, cell_x * columns + cell_y, -1)
+            low = numpy.searchsorted(keys, query_keys, side="left")
+            high = numpy.searchsorted(keys, query_keys, side="right")
+            matches = high - low
+
+            query = numpy.repeat(numpy.arange(len(queries)), matches)
+            candidate = segment[numpy.repeat(low, matches) + numpy.arange(matches.sum())
+                                - numpy.repeat(numpy.cumsum(matches) - matches, matches)]
+            gap = _segment_distances(queries[query], starts[candidate], ends[candidate])
+            closer[query[gap < distance]] = True
+    return closer
+
+
+def _segment_distances(queries, starts, ends):
+    vector = ends - starts
+    relative = queries - starts
+    length = numpy.maximum(numpy.einsum("ij,ij->i", vector, vector), EPSILON)
+    t = numpy.clip(numpy.einsum("ij,ij->i", relative, vector) / length, 0.0, 1.0)
+    return numpy.linalg.norm(relative - vector * t[:, None], axis=1)
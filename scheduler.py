@@ -0,0 +1,58 @@
+import time
+
+import bpy
+
+from .globals import append_file_handler, remove_file_handler
+
+
+class SyncScheduler:
+    """Coalesces the objects to sync during interactive edits and syncs them at a bounded rate."""
+
+    def __init__(self):
+        self.dirty = dict()
+        self.last_flush = 0.0
+        self.sync_func = None
+        # Timers are identified by the registered function object, keep a single bound method around
+        self.timer = self.flush
+
+    def schedule(self, obj, geometry, interval):
+        key = obj.as_pointer()
+        self.dirty[key] = (obj, geometry or key in self.dirty and self.dirty[key][1])
+        if not bpy.app.timers.is_registered(self.timer):
+            delay = max(0.0, self.last_flush + interval - time.monotonic())
+            bpy.app.timers.register(self.timer, first_interval=delay)
+
+    def flush(self):
+        dirty_objs = list(self.dirty.values())
+        self.dirty.clear()
+        self.last_flush = time.monotonic()
+        self.sync_func(dirty_objs, bpy.context)
+        return None
+
+    def sync(self, objs, context):
+        # Syncs right away in a single pass, sources before their dependents, e.g. objects created by an operator
+        self.sync_func(objs, context)
+
+    def cancel(self):
+        if bpy.app.timers.is_registered(self.timer):
+            bpy.app.timers.unregister(self.timer)
+        self.dirty.clear()
+
+
+sync_scheduler = SyncScheduler()
+
+
+@bpy.app.handlers.persistent
+def cancel_scheduled_syncs(_):
+    sync_scheduler.cancel()
+
+
+def register(sync_func):
+    sync_scheduler.sync_func = sync_func
+    append_file_handler(cancel_scheduled_syncs)
+
+
+def unregister():
+    remove_file_handler(cancel_scheduled_syncs)
+    sync_scheduler.cancel()
+    sync_scheduler.sync_func = None
@@ -1,12 +1,53 @@
-import bmesh
 import bpy
 import bpy_extras
+import itertools
 import math
+from array import array
 from bpy.props import BoolProperty, FloatProperty, EnumProperty, IntProperty
 from mathutils import Vector
 
-from .globals import has_sinegear_data, get_sinegear_data, get_sinegear_enum, make_sinegear_data
-from .utils import polar_to_xy, Lockable, if_unlocked
+from .globals import append_file_handler, has_sinegear_data, get_sinegear_data, get_sinegear_enum, \
+    make_sinegear_data, remove_file_handler
+from .utils import polar_to_xy, Lockable, if_unlocked, new_buffer, new_object, numpy
+
+ADAPTIVE_MIN_TOOTH_SAMPLES = 2
+ADAPTIVE_SAMPLES = 256
+SHARED_GEOMETRY_KEY = "sinegear_key"
+
+
+# noinspection PyPep8Naming
+def AdaptiveProperty(update=None):
+    return BoolProperty(
+        name="Adaptive",
+        default=False,
+        description="Place points according to the profile curvature instead of evenly",
+        update=update)
+
+
+# noinspection PyPep8Naming
+def BoreRadiusProperty(update=None):
+    return FloatProperty(
+        name="BoreRadius",
+        default=0.0,
+        description="Bore radius",
+        min=0.0,
+        soft_min=0.0,
+        step=1,
+        unit="LENGTH",
+        update=update)
+
+
+# noinspection PyPep8Naming
+def ChamferProperty(update=None):
+    return FloatProperty(
+        name="Chamfer",
+        default=0.0,
+        description="Chamfer",
+        min=0.0,
+        soft_min=0.0,
+        step=1,
+        unit="LENGTH",
+        update=update)
 
 
 # noinspection PyPep8Naming
@@ -68,108 +109,401 @@ def TeethLengthProperty(update=None):
         update=update)
 
 
+# noinspection PyPep8Naming
+def ThicknessProperty(update=None):
+    return FloatProperty(
+        name="Thickness",
+        default=0.1,
+        description="Thickness",
+        min=0.0,
+        soft_min=0.0,
+        step=1,
+        unit="LENGTH",
+        update=update)
+
+
+# noinspection PyPep8Naming
+def ToleranceProperty(update=None):
+    return FloatProperty(
+        name="Tolerance",
+        default=0.001,
+        description="Maximum distance between the adaptive profile and the exact sine curve",
+        min=0.000001,
+        soft_min=0.00001,
+        step=0.01,
+        precision=5,
+        unit="LENGTH",
+        update=update)
+
+
 # noinspection PyPep8Naming
 def TypeProperty(update=None):
     return EnumProperty(
         items=[
             ("MESH", "Mesh", ""),
-            ("POLY", "Poly", "")],
+            ("POLY", "Poly", ""),
+            ("SOLID", "Solid", "")],
         name="Type",
         description="Type",
         default="POLY",
         update=update)
 
 
+def uniform_angles(points_count):
+    if numpy is not None:
+        return numpy.radians(-180 + numpy.arange(points_count) * (360 / points_count))
+    return array("d", [math.radians(-180 + (i * 360 / points_count)) for i in range(points_count)])
+
+
+def adaptive_angles(radius, teeth_count, teeth_length, tolerance):
+    # Teeth are identical, the angles sampled along the first one are repeated for the others
+    period = 2 * math.pi / teeth_count
+    tooth_angles = adaptive_tooth_angles(radius, teeth_count, teeth_length, tolerance, period)
+    if numpy is not None:
+        return (numpy.arange(teeth_count)[:, None] * period + numpy.array(tooth_angles)).ravel() - math.pi
+    return array("d", [tooth * period + angle - math.pi for tooth in range(teeth_count) for angle in tooth_angles])
+
+
+def adaptive_tooth_angles(radius, teeth_count, teeth_length, tolerance, period):
+    # The chordal error of a step ds along a curve of curvature k is about k * ds ** 2 / 8. Integrating the number of
+    # steps needed per radian gives the cumulative count of samples, which is inverted to place them.
+    densities = list()
+    for i in range(ADAPTIVE_SAMPLES + 1):
+        theta = i * period / ADAPTIVE_SAMPLES - math.pi
+        r = radius + math.sin(theta * teeth_count) * teeth_length
+        dr = teeth_count * teeth_length * math.cos(theta * teeth_count)
+        d2r = -teeth_count * teeth_count * teeth_length * math.sin(theta * teeth_count)
+        speed = max(math.sqrt(r * r + dr * dr), 1e-12)
+        curvature = abs(r * r + 2 * dr * dr - r * d2r) / speed ** 3
+        densities.append(speed * math.sqrt(curvature / (8 * tolerance)))
+
+    step = period / ADAPTIVE_SAMPLES
+    cumulative = [0.0]
+    for i in range(ADAPTIVE_SAMPLES):
+        cumulative.append(cumulative[-1] + (densities[i] + densities[i + 1]) * step / 2)
+
+    samples_count = max(ADAPTIVE_MIN_TOOTH_SAMPLES, math.ceil(cumulative[-1]))
+    angles = list()
+    i = 0
+    for sample in range(samples_count):
+        target = sample * cumulative[-1] / samples_count
+        while cumulative[i + 1] < target:
+            i += 1
+        span = cumulative[i + 1] - cumulative[i]
+        angles.append((i + ((target - cumulative[i]) / span if span > 0 else 0.0)) * step)
+    return angles
+
+
+def sine_gear_profile(radius, teeth_count, teeth_length, angles, components):
+    # Flat coordinates buffer of the profile points, Z being 0 and W, with 4 components, being 1
+    points_count = len(angles)
+    if numpy is not None:
+        r = radius + numpy.sin(angles * teeth_count) * teeth_length
+        co = numpy.zeros((points_count, components), dtype=numpy.float32)
+        co[:, 0] = r * numpy.cos(angles)
+        co[:, 1] = r * numpy.sin(angles)
+        co[:, 3:] = 1.0
+        return co.ravel()
+
+    co = new_buffer("f", points_count * components)
+    for i, theta in enumerate(angles):
+        co[i * components], co[i * components + 1] = polar_to_xy(radius + math.sin(theta * teeth_count) * teeth_length,
+                                                                 theta)
+        if components == 4:
+            co[i * components + 3] = 1.0
+    return co
+
+
+def solid_gear(co, angles, thickness, bore_radius, chamfer):
+    # Stacked rings of the profile, chamfered ones being inset along the profile normals, closed by caps or by an
+    # annulus to the bore. Returns the flat vertex coordinates, polygon vertex indices and polygon sizes.
+    profile = co.reshape(-1, 3)[:, :2]
+    points_count = len(profile)
+    chamfer = min(chamfer, thickness / 2)
+    if chamfer > 0.0:
+        tangents = numpy.roll(profile, -1, axis=0) - numpy.roll(profile, 1, axis=0)
+        normals = numpy.stack((tangents[:, 1], -tangents[:, 0]), axis=1) / numpy.hypot(tangents[:, 0],
+                                                                                      tangents[:, 1])[:, None]
+        inset = profile - chamfer * normals
+        rings = [(inset, 0.0), (profile, chamfer), (profile, thickness - chamfer), (inset, thickness)]
+    else:
+        rings = [(profile, 0.0), (profile, thickness)]
+    bottom, top = 0, len(rings) - 1
+    if bore_radius > 0.0:
+        rings += [(bore_radius * numpy.stack((numpy.cos(angles), numpy.sin(angles)), axis=1), 0.0),
+                  (bore_radius * numpy.stack((numpy.cos(angles), numpy.sin(angles)), axis=1), thickness)]
+
+    solid_co = numpy.zeros((len(rings), points_count, 3), dtype=numpy.float32)
+    for ring, (xy, z) in enumerate(rings):
+        solid_co[ring, :, :2] = xy
+        solid_co[ring, :, 2] = z
+
+    current = numpy.arange(points_count, dtype=numpy.int32)
+    following = numpy.roll(current, -1)
+
+    def band(lower, upper):
+        # Quads facing outwards when the lower ring is below the upper one
+        return numpy.stack((lower * points_count + current,
+                            lower * points_count + following,
+                            upper * points_count + following,
+                            upper * points_count + current), axis=1).ravel()
+
+    polygons = [band(ring, ring + 1) for ring in range(top)]
+    if bore_radius > 0.0:
+        bore_bottom, bore_top = top + 1, top + 2
+        polygons += [band(bore_top, bore_bottom), band(top, bore_top), band(bore_bottom, bottom)]
+        loop_totals = numpy.full(len(polygons) * points_count, 4, dtype=numpy.int32)
+    else:
+        polygons += [top * points_count + current, bottom * points_count + current[::-1]]
+        loop_totals = numpy.concatenate((numpy.full(top * points_count, 4, dtype=numpy.int32),
+                                         numpy.array([points_count, points_count], dtype=numpy.int32)))
+    return solid_co.ravel(), numpy.concatenate(polygons), loop_totals
+
+
+def load_polygons(mesh, vertex_indices, loop_totals):
+    if numpy is not None:
+        loop_starts = numpy.cumsum(loop_totals, dtype=numpy.int32) - loop_totals
+    else:
+        loop_starts = array("i", [sum(loop_totals[:i]) for i in range(len(loop_totals))])
+    mesh.loops.add(len(vertex_indices))
+    mesh.loops.foreach_set("vertex_index", vertex_indices)
+    mesh.polygons.add(len(loop_totals))
+    mesh.polygons.foreach_set("loop_start", loop_starts)
+    # Since Blender 4.0, polygon sizes follow from the loop starts and can not be written
+    if not bpy.types.MeshPolygon.bl_rna.properties["loop_total"].is_readonly:
+        mesh.polygons.foreach_set("loop_total", loop_totals)
+
+
+def ring_indices(count):
+    # Vertex indices of the closed ring of edges (0, 1), (1, 2) ... (count - 1, 0)
+    if numpy is not None:
+        indices = numpy.arange(count, dtype=numpy.int32)
+        return numpy.stack((indices, numpy.roll(indices, -1)), axis=1).ravel()
+    return array("i", [index for i in range(count) for index in (i, (i + 1) % count)])
+
+
+def sequence_indices(count):
+    if numpy is not None:
+        return numpy.arange(count, dtype=numpy.int32)
+    return array("i", range(count))
+
+
+class SharedGeometry:
+    """Geometry datablocks shared by the SineGear objects with identical parameters, tagged with their key."""
+
+    def __init__(self):
+        self.entries = dict()
+
+    def clear(self):
+        self.entries.clear()
+
+    def rebuild(self):
+        self.entries.clear()
+        for datablocks in (bpy.data.meshes, bpy.data.curves):
+            for data in datablocks:
+                key = data.get(SHARED_GEOMETRY_KEY)
+                if key is not None:
+                    self.entries[key] = (datablocks_name(data), data.name)
+
+    def find(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        # Meshes and curves have separate name spaces, a curve may have the name of a shared mesh
+        collection_name, name = entry
+        data = getattr(bpy.data, collection_name).get(name)
+        # Renamed or retagged datablocks are no longer found under their key
+        return data if data is not None and data.get(SHARED_GEOMETRY_KEY) == key else None
+
+    def add(self, key, data):
+        self.discard(data)
+        data[SHARED_GEOMETRY_KEY] = key
+        self.entries[key] = (datablocks_name(data), data.name)
+
+    def discard(self, data):
+        key = data.get(SHARED_GEOMETRY_KEY)
+        if key is not None:
+            del data[SHARED_GEOMETRY_KEY]
+            if self.entries.get(key) == (datablocks_name(data), data.name):
+                del self.entries[key]
+
+    def collect_garbage(self):
+        for key in list(self.entries):
+            data = self.find(key)
+            if data is None:
+                del self.entries[key]
+            elif data.users == 0:
+                del self.entries[key]
+                remove_datablock(data)
+
+
+shared_geometry = SharedGeometry()
+
+
+def datablocks_name(data):
+    return "meshes" if isinstance(data, bpy.types.Mesh) else "curves"
+
+
+def remove_datablock(data):
+    getattr(bpy.data, datablocks_name(data)).remove(data)
+
+
 class SineGearData(bpy.types.PropertyGroup, Lockable):
 
+    def geometry_key(self):
+        # Only the parameters the type and sampling mode use, gears differing in the others are identical
+        key = (self.type, self.radius, self.teeth_count, self.teeth_length, self.adaptive)
+        key += (self.tolerance,) if self.adaptive else (self.resolution,)
+        if self.type == "SOLID":
+            key += (self.thickness, self.bore_radius, self.chamfer)
+        else:
+            key += (self.make_face,)
+        return repr(key)
+
     def generate(self, context):
-        points_count = self.resolution * self.teeth_count
+        self.assign_geometry()
+        shared_geometry.collect_garbage()
 
-        def step_to_theta(i):
-            theta_min = -180
-            theta_max = 180
-            return math.radians(theta_min + (i * (theta_max - theta_min) / points_count))
+    def regenerate(self, context):
+        self.generate(context)
+
+    def assign_geometry(self):
+        obj: bpy.types.Object = self.id_data
+        if obj.mode == "EDIT":
+            bpy.ops.object.mode_set(mode='OBJECT')
 
-        polar_path = [(self.radius + (math.sin(theta * self.teeth_count) * self.teeth_length), theta)
-                      for theta in map(step_to_theta, range(0, points_count))]
-        path = [polar_to_xy(r, theta) for r, theta in polar_path]
+        # Identical gears share one datablock, the object's own datablock is regenerated in place when not shared
+        key = self.geometry_key()
+        data = shared_geometry.find(key)
+        if data is None:
+            data = obj.data
+            if data.users > 1:
+                data = obj.data.copy()
+            self.generate_data(data)
+            shared_geometry.add(key, data)
+
+        previous_data = obj.data
+        if previous_data != data:
+            obj.data = data
+            if previous_data.users == 0:
+                shared_geometry.discard(previous_data)
+                remove_datablock(previous_data)
+
+    def generate_data(self, data):
+        if self.adaptive:
+            angles = adaptive_angles(self.radius, self.teeth_count, self.teeth_length, self.tolerance)
+        else:
+            angles = uniform_angles(self.resolution * self.teeth_count)
         if self.type == "MESH":
-            self.generate_mesh(path)
+            co = sine_gear_profile(self.radius, self.teeth_count, self.teeth_length, angles, 3)
+            self.generate_mesh(data, co)
         elif self.type == "POLY":
-            self.generate_curve(path)
+            co = sine_gear_profile(self.radius, self.teeth_count, self.teeth_length, angles, 4)
+            self.generate_curve(data, co)
+        elif self.type == "SOLID":
+            if numpy is None:
+                raise RuntimeError("Solid gears require NumPy")
+            co = sine_gear_profile(self.radius, self.teeth_count, self.teeth_length, angles, 3)
+            self.generate_solid(data, co, angles)
         else:
             raise RuntimeError(f"Unknown object type {self.type}")
 
-    def generate_curve(self, path):
-        curve: bpy.types.Curve = self.id_data.data
+    def generate_curve(self, curve: bpy.types.Curve, co):
         curve.dimensions = "2D"
         curve.resolution_u = 2
         curve.splines.clear()
         polyline = curve.splines.new('POLY')
 
-        polyline.points.add(len(path) - 1)
-        for i, (x, y) in enumerate(path):
-            polyline.points[i].co = (x, y, 0.0, 1.0)
+        polyline.points.add(len(co) // 4 - 1)
+        polyline.points.foreach_set("co", co)
 
         polyline.use_cyclic_u = True
         polyline.use_cyclic_v = True
-        bpy.context.object.data.fill_mode = "BOTH" if self.make_face else "NONE"
-
-        # bpy.ops.object.mode_set(mode="EDIT")
-        # bpy.ops.curve.select_all(action="SELECT")
-        # bpy.ops.curvetools.add_toolpath_offset_curve(offset=-0.1, pitch=-0.09, step_angle=0.0245437, count=1)
-        # curve.splines.remove(curve.splines.active)
-        # bpy.ops.object.mode_set(mode="OBJECT")
+        curve.fill_mode = "BOTH" if self.make_face else "NONE"
 
-    def generate_mesh(self, path):
-        bm = bmesh.new()
-        verts = [bm.verts.new(Vector((x, y, 0.0))) for (x, y) in path]
+    def generate_mesh(self, mesh: bpy.types.Mesh, co):
+        points_count = len(co) // 3
+        mesh.clear_geometry()
+        mesh.vertices.add(points_count)
+        mesh.vertices.foreach_set("co", co)
         if not self.make_face:
-            [bm.edges.new((verts[i], verts[(i + 1) % len(verts)])) for i in range(0, len(verts))]
+            mesh.edges.add(points_count)
+            mesh.edges.foreach_set("vertices", ring_indices(points_count))
         else:
-            bm.faces.new(verts)
-
-        if self.id_data.data.is_editmode:
-            bpy.ops.object.mode_set(mode='OBJECT')
-        bm.to_mesh(self.id_data.data)
-        bm.free()
-        self.id_data.data.update()
-
+            load_polygons(mesh, sequence_indices(points_count), array("i", [points_count]))
+        mesh.update(calc_edges=self.make_face)
+
+    def generate_solid(self, mesh: bpy.types.Mesh, co, angles):
+        solid_co, vertex_indices, loop_totals = solid_gear(co, angles, self.thickness, self.bore_radius, self.chamfer)
+        mesh.clear_geometry()
+        mesh.vertices.add(len(solid_co) // 3)
+        mesh.vertices.foreach_set("co", solid_co)
+        load_polygons(mesh, vertex_indices, loop_totals)
+        mesh.update(calc_edges=True)
+
+    adaptive: AdaptiveProperty(update=if_unlocked(generate))
+    bore_radius: BoreRadiusProperty(update=if_unlocked(generate))
+    chamfer: ChamferProperty(update=if_unlocked(generate))
     make_face: MakeFaceProperty(update=if_unlocked(generate))
     radius: RadiusProperty(update=if_unlocked(generate))
     resolution: ResolutionProperty(update=if_unlocked(generate))
     teeth_count: TeethCountProperty(update=if_unlocked(generate))
     teeth_length: TeethLengthProperty(update=if_unlocked(generate))
+    thickness: ThicknessProperty(update=if_unlocked(generate))
+    tolerance: ToleranceProperty(update=if_unlocked(generate))
     type: TypeProperty(update=if_unlocked(generate))
 
 
+def sweep_values(start, end, steps):
+    if steps <= 1:
+        return [start]
+    return [start + (end - start) * i / (steps - 1) for i in range(steps)]
+
+
+def new_sinegear_datablock(sinegear_type):
+    if sinegear_type in ("MESH", "SOLID"):
+        return bpy.data.meshes.new("SineGear")
+    elif sinegear_type == "POLY":
+        return bpy.data.curves.new("Sinegear", type='CURVE')
+    else:
+        raise RuntimeError(f"Unknown object type {sinegear_type}")
+
+
 class SineGear(bpy.types.Operator):
     bl_idname = "object.sinegear"
     bl_description = "Sinusoidal gear shape"
     bl_label = "Sine Gear"
     bl_options = {"REGISTER", "UNDO"}
 
+    adaptive: AdaptiveProperty()
+    bore_radius: BoreRadiusProperty()
+    chamfer: ChamferProperty()
     make_face: MakeFaceProperty()
     radius: RadiusProperty()
     resolution: ResolutionProperty()
     teeth_count: TeethCountProperty()
     teeth_length: TeethLengthProperty()
+    thickness: ThicknessProperty()
+    tolerance: ToleranceProperty()
     type: TypeProperty()
 
     def execute(self, context):
-        if self.type == "MESH":
-            obdata = bpy.data.meshes.new("SineGear")
-        elif self.type == "POLY":
-            obdata = bpy.data.curves.new("Sinegear", type='CURVE')
-        else:
-            raise RuntimeError(f"Unknown object type {self.type}")
+        if self.type == "SOLID" and numpy is None:
+            self.report({"ERROR"}, "Solid gears require NumPy")
+            return {"CANCELLED"}
 
         obj = bpy_extras.object_utils.object_data_add(context,
-                                                      obdata=obdata,
+                                                      obdata=new_sinegear_datablock(self.type),
                                                       operator=None)
 
         sinegear_data: SineGearData = make_sinegear_data(obj)
         sinegear_data.lock()
+        if self.adaptive != sinegear_data.adaptive:
+            sinegear_data.adaptive = self.adaptive
+        if self.bore_radius != sinegear_data.bore_radius:
+            sinegear_data.bore_radius = self.bore_radius
+        if self.chamfer != sinegear_data.chamfer:
+            sinegear_data.chamfer = self.chamfer
         if self.make_face != sinegear_data.make_face:
             sinegear_data.make_face = self.make_face
         if self.radius != sinegear_data.radius:
@@ -180,6 +514,10 @@ class SineGear(bpy.types.Operator):
             sinegear_data.teeth_count = self.teeth_count
         if self.teeth_length != sinegear_data.teeth_length:
             sinegear_data.teeth_length = self.teeth_length
+        if self.thickness != sinegear_data.thickness:
+            sinegear_data.thickness = self.thickness
+        if self.tolerance != sinegear_data.tolerance:
+            sinegear_data.tolerance = self.tolerance
         if self.type != sinegear_data.type:
             sinegear_data.type = self.type
 
@@ -188,6 +526,124 @@ class SineGear(bpy.types.Operator):
         return {"FINISHED"}
 
 
+def grid_layout(parameter_sets, spacing=0.0):
+    # Offsets of the cells of a square grid, a spacing of 0 fitting the cells to the largest gear
+    if len(parameter_sets) == 0:
+        return list()
+    if spacing <= 0.0:
+        defaults = SineGearData.bl_rna.properties
+        spacing = 2.5 * max(parameters.get("radius", defaults["radius"].default)
+                            + parameters.get("teeth_length", defaults["teeth_length"].default)
+                            for parameters in parameter_sets)
+    columns = math.ceil(math.sqrt(len(parameter_sets)))
+    return [((index % columns) * spacing, -(index // columns) * spacing, 0.0) for index in range(len(parameter_sets))]
+
+
+def generate_sinegears(context, parameter_sets, offsets):
+    """Generate one SineGear per dictionary of SineGear parameters, placed at the given offsets from the 3D cursor.
+
+    Parameters are set while the gear data is locked and each geometry is then assigned once, gears with identical
+    parameters sharing their datablock. Returns the created objects.
+    """
+    # Gears start on a common empty datablock per datablock type, replaced by their geometry
+    default_type = SineGearData.bl_rna.properties["type"].default
+    placeholders = dict()
+    objs = list()
+    for parameters, offset in zip(parameter_sets, offsets):
+        sinegear_type = parameters.get("type", default_type)
+        placeholder_type = "CURVE" if sinegear_type == "POLY" else "MESH"
+        if placeholder_type not in placeholders:
+            placeholders[placeholder_type] = new_sinegear_datablock(sinegear_type)
+        obj = new_object(context, "SineGear", placeholders[placeholder_type])
+        obj.location += Vector(offset)
+        sinegear_data: SineGearData = make_sinegear_data(obj)
+        sinegear_data.lock()
+        for name, value in parameters.items():
+            setattr(sinegear_data, name, value)
+        sinegear_data.unlock()
+        sinegear_data.assign_geometry()
+        objs.append(obj)
+
+    for placeholder in placeholders.values():
+        if placeholder.users == 0:
+            remove_datablock(placeholder)
+    shared_geometry.collect_garbage()
+    return objs
+
+
+def generate_sinegear_sweep(context, radii, teeth_counts, teeth_lengths, resolutions, spacing=0.0, **settings):
+    """Generate one SineGear per combination of the given parameter values, laid out on a grid from the 3D cursor.
+
+    Other SineGear parameters, such as type or make_face, are given as keyword arguments and shared by every gear. A
+    spacing of 0 fits the grid cells to the largest gear. Returns the created objects.
+    """
+    parameter_sets = [dict(settings, radius=radius, teeth_count=teeth_count, teeth_length=teeth_length,
+                           resolution=resolution)
+                      for radius, teeth_count, teeth_length, resolution
+                      in itertools.product(radii, teeth_counts, teeth_lengths, resolutions)]
+    return generate_sinegears(context, parameter_sets, grid_layout(parameter_sets, spacing))
+
+
+class SineGearSweep(bpy.types.Operator):
+    bl_idname = "object.sinegear_sweep"
+    bl_description = "Grid of sinusoidal gears sweeping ranges of parameters"
+    bl_label = "Sine Gear sweep"
+    bl_options = {"REGISTER", "UNDO"}
+
+    adaptive: AdaptiveProperty()
+    bore_radius: BoreRadiusProperty()
+    chamfer: ChamferProperty()
+    make_face: MakeFaceProperty()
+    thickness: ThicknessProperty()
+    tolerance: ToleranceProperty()
+    type: TypeProperty()
+
+    radius_start: FloatProperty(name="Radius start", default=1.0, min=0.0, step=1, unit="LENGTH")
+    radius_end: FloatProperty(name="Radius end", default=2.0, min=0.0, step=1, unit="LENGTH")
+    radius_steps: IntProperty(name="Radius steps", default=1, min=1, soft_max=32)
+    teeth_count_start: IntProperty(name="Teeth count start", default=8, min=1)
+    teeth_count_end: IntProperty(name="Teeth count end", default=64, min=1)
+    teeth_count_steps: IntProperty(name="Teeth count steps", default=8, min=1, soft_max=64)
+    teeth_length_start: FloatProperty(name="Teeth length start", default=0.1, min=0.0, step=1, unit="LENGTH")
+    teeth_length_end: FloatProperty(name="Teeth length end", default=0.2, min=0.0, step=1, unit="LENGTH")
+    teeth_length_steps: IntProperty(name="Teeth length steps", default=1, min=1, soft_max=32)
+    resolution_start: IntProperty(name="Resolution start", default=2, min=2)
+    resolution_end: IntProperty(name="Resolution end", default=8, min=2)
+    resolution_steps: IntProperty(name="Resolution steps", default=1, min=1, soft_max=32)
+    spacing: FloatProperty(name="Spacing", default=0.0, min=0.0, unit="LENGTH",
+                           description="Distance between gears, 0 to fit the largest gear")
+
+    def execute(self, context):
+        if self.type == "SOLID" and numpy is None:
+            self.report({"ERROR"}, "Solid gears require NumPy")
+            return {"CANCELLED"}
+
+        radii = sweep_values(self.radius_start, self.radius_end, self.radius_steps)
+        teeth_counts = sorted(set(round(value) for value in sweep_values(self.teeth_count_start,
+                                                                         self.teeth_count_end,
+                                                                         self.teeth_count_steps)))
+        teeth_lengths = sweep_values(self.teeth_length_start, self.teeth_length_end, self.teeth_length_steps)
+        resolutions = sorted(set(round(value) for value in sweep_values(self.resolution_start,
+                                                                        self.resolution_end,
+                                                                        self.resolution_steps)))
+
+        for obj in context.selected_objects:
+            obj.select_set(False)
+        objs = generate_sinegear_sweep(context, radii, teeth_counts, teeth_lengths, resolutions,
+                                       spacing=self.spacing,
+                                       adaptive=self.adaptive,
+                                       bore_radius=self.bore_radius,
+                                       chamfer=self.chamfer,
+                                       make_face=self.make_face,
+                                       thickness=self.thickness,
+                                       tolerance=self.tolerance,
+                                       type=self.type)
+        for obj in objs:
+            obj.select_set(True)
+        context.view_layer.objects.active = objs[-1]
+        return {"FINISHED"}
+
+
 class SineGearEditPanel(bpy.types.Panel):
     """Creates a Panel in the data context of the properties editor"""
     bl_idname = "DATA_PT_SineGear"
@@ -211,19 +667,41 @@ class SineGearEditPanel(bpy.types.Panel):
         layout.use_property_split = True
         layout.label(text="Type: %s" % sinegear_enum.name, icon="MESH_CUBE")
         layout.prop(sinegear_data, "radius", text=sinegear_props["radius"].description)
-        layout.prop(sinegear_data, "resolution", text=sinegear_props["resolution"].description)
         layout.prop(sinegear_data, "teeth_count", text=sinegear_props["teeth_count"].description)
         layout.prop(sinegear_data, "teeth_length", text=sinegear_props["teeth_length"].description)
-        layout.prop(sinegear_data, "make_face", text=sinegear_props["make_face"].description)
+        layout.prop(sinegear_data, "adaptive", text=sinegear_props["adaptive"].name)
+        sampling_col = layout.column(align=True)
+        sampling_col.prop(sinegear_data, "tolerance", text=sinegear_props["tolerance"].name)
+        sampling_col.enabled = sinegear_data.adaptive
+        resolution_col = layout.column(align=True)
+        resolution_col.prop(sinegear_data, "resolution", text=sinegear_props["resolution"].description)
+        resolution_col.enabled = not sinegear_data.adaptive
+        if sinegear_data.type == "SOLID":
+            layout.prop(sinegear_data, "thickness", text=sinegear_props["thickness"].description)
+            layout.prop(sinegear_data, "bore_radius", text=sinegear_props["bore_radius"].description)
+            layout.prop(sinegear_data, "chamfer", text=sinegear_props["chamfer"].description)
+        else:
+            layout.prop(sinegear_data, "make_face", text=sinegear_props["make_face"].description)
+
+
+@bpy.app.handlers.persistent
+def rebuild_shared_geometry(_):
+    shared_geometry.rebuild()
 
 
 def register():
+    shared_geometry.clear()
+    append_file_handler(rebuild_shared_geometry, post=True)
     bpy.utils.register_class(SineGearData)
     bpy.utils.register_class(SineGear)
+    bpy.utils.register_class(SineGearSweep)
     bpy.utils.register_class(SineGearEditPanel)
 
 
 def unregister():
     bpy.utils.unregister_class(SineGearEditPanel)
+    bpy.utils.unregister_class(SineGearSweep)
     bpy.utils.unregister_class(SineGear)
     bpy.utils.unregister_class(SineGearData)
+    remove_file_handler(rebuild_shared_geometry, post=True)
+    shared_geometry.clear()
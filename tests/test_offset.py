@@ -0,0 +1,95 @@
+import importlib.util
+import math
+import os
+
+import numpy
+import pytest
+
+# The add-on package imports bpy, the offset module only depends on NumPy and is loaded on its own
+spec = importlib.util.spec_from_file_location("offset", os.path.join(os.path.dirname(__file__), os.pardir, "offset.py"))
+offset = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(offset)
+
+RESOLUTION = math.pi / 16
+
+
+def circle(count, radius=1.0):
+    angles = numpy.linspace(0.0, 2.0 * math.pi, count, endpoint=False)
+    return numpy.stack((radius * numpy.cos(angles), radius * numpy.sin(angles), numpy.zeros(count)), axis=1)
+
+
+def square(half_size=1.0):
+    # Counter-clockwise
+    return numpy.array([[-1, -1, 0], [1, -1, 0], [1, 1, 0], [-1, 1, 0]], dtype=numpy.float64) * half_size
+
+
+@pytest.mark.parametrize("distance, radius", [(0.1, 0.9), (-0.1, 1.1)])
+def test_positive_offset_moves_left(distance, radius):
+    # Left of a counter-clockwise circle is inside
+    traces = offset.offset_polyline(circle(256), True, distance, RESOLUTION, True)
+    assert len(traces) == 1
+    assert numpy.allclose(numpy.linalg.norm(traces[0][:, :2], axis=1), radius, atol=1e-3)
+
+
+def test_open_polyline_offset():
+    traces = offset.offset_polyline(numpy.array([[0, 0, 0], [2, 0, 0]], dtype=numpy.float64), False, 1.0,
+                                    RESOLUTION, True)
+    assert len(traces) == 1
+    assert numpy.allclose(traces[0], [[0, 1, 0], [2, 1, 0]])
+
+
+@pytest.mark.parametrize("distance", [0.1, -0.1])
+def test_round_join_below_resolution_adds_no_points(distance):
+    points = circle(20000)
+    traces = offset.offset_polyline(points, True, distance, RESOLUTION, True)
+    assert sum(len(trace) for trace in traces) == len(points)
+
+
+def test_round_join_arcs():
+    traces = offset.offset_polyline(square(), True, -1.0, RESOLUTION, True)
+    assert len(traces) == 1
+    trace = traces[0]
+    # Each right angle corner is an arc of 8 steps, its points at the offset distance from the corner
+    assert len(trace) == 4 * 9
+    corners = square()[:, :2]
+    gaps = numpy.min(numpy.linalg.norm(trace[:, None, :2] - corners[None, :, :], axis=2), axis=1)
+    assert numpy.allclose(gaps, 1.0)
+
+
+@pytest.mark.parametrize("distance, half_size", [(-1.0, 2.0), (0.5, 0.5)])
+def test_miter_join(distance, half_size):
+    traces = offset.offset_polyline(square(), True, distance, RESOLUTION, False)
+    assert len(traces) == 1
+    assert numpy.allclose(traces[0], square(half_size))
+
+
+def test_offset_wider_than_shape_is_cut_away():
+    assert offset.offset_polyline(square(), True, 1.5, RESOLUTION, True) == []
+
+
+@pytest.mark.parametrize("jitter", [0.002, 0.01])
+@pytest.mark.parametrize("distance", [0.05, -0.05])
+def test_dense_noisy_offset(jitter, distance):
+    # Every jittered segment crosses its neighbours' offsets, the loop at the distance from all of them is kept whole
+    rng = numpy.random.default_rng(0)
+    points = circle(20000) * rng.uniform(1.0 - jitter, 1.0 + jitter, 20000)[:, None]
+    traces = offset.offset_polyline(points, True, distance, RESOLUTION, True)
+    assert len(traces) == 1
+    trace = traces[0]
+    assert not offset._closer_than(trace[:, :2], points[:, :2], numpy.roll(points, -1, axis=0)[:, :2],
+                                   abs(distance) * math.cos(RESOLUTION / 2.0)).any()
+    # The trace lies between the offsets of the circles bounding the jitter
+    inner, outer = 1.0 - jitter - distance, 1.0 + jitter - distance
+    assert math.pi * inner ** 2 < offset._signed_area(trace) < math.pi * outer ** 2
+
+
+def test_dense_noisy_open_offset():
+    rng = numpy.random.default_rng(0)
+    points = (circle(20000) * rng.uniform(0.99, 1.01, 20000)[:, None])[:5000]
+    traces = offset.offset_polyline(points, False, 0.05, RESOLUTION, True)
+    assert len(traces) == 1
+    trace = traces[0]
+    # Open traces keep their end points
+    assert numpy.allclose(numpy.linalg.norm(trace[[0, -1], :2] - points[[0, -1], :2], axis=1), 0.05)
+    closest = 0.05 * math.cos(RESOLUTION / 2.0)
+    assert not offset._closer_than(trace[:, :2], points[:-1, :2], points[1:, :2], closest).any()
@@ -0,0 +1,112 @@
+import contextlib
+
+import bpy
+
+from .dependencies import dependents_index
+from .globals import append_file_handler, remove_file_handler
+
+
+class UpdateTransactions:
+    """Property updates deferred while a transaction is open, to regenerate each touched object once when it closes."""
+
+    def __init__(self):
+        self.depth = 0
+        self.batch = False
+        self.object_depths = dict()
+        self.updates = dict()
+
+    def is_open(self, data):
+        return self.depth > 0 or data.id_data.as_pointer() in self.object_depths
+
+    def record(self, data, func):
+        funcs = self.updates.setdefault(data.id_data.as_pointer(), (data, list()))[1]
+        if func not in funcs:
+            funcs.append(func)
+
+    @contextlib.contextmanager
+    def transaction(self, data=None, batch=False):
+        recorded = set(self.updates)
+        if data is None:
+            self.depth += 1
+            self.batch = self.batch or batch
+            try:
+                yield
+            except BaseException:
+                self.discard(recorded)
+                raise
+            finally:
+                self.depth -= 1
+                if self.depth == 0:
+                    batch, self.batch = self.batch, False
+                    self.flush(list(self.updates), batch)
+        else:
+            key = data.id_data.as_pointer()
+            self.object_depths[key] = self.object_depths.get(key, 0) + 1
+            try:
+                yield
+            except BaseException:
+                self.discard(recorded)
+                raise
+            finally:
+                self.object_depths[key] -= 1
+                if self.object_depths[key] == 0:
+                    del self.object_depths[key]
+                    # Inside a global transaction, the object is regenerated with the others when it closes
+                    if self.depth == 0:
+                        self.flush([key], False)
+
+    def discard(self, recorded):
+        # Objects touched before the failing transaction opened still regenerate with the transaction enclosing it
+        for key in set(self.updates) - recorded:
+            del self.updates[key]
+
+    def flush(self, keys, batch):
+        updates = [self.updates.pop(key) for key in keys if key in self.updates]
+        if batch:
+            # Objects in a source cycle come last, as they would have been regenerated outside the transaction
+            updates_by_obj = {data.id_data.as_pointer(): (data, funcs) for data, funcs in updates}
+            sorted_objs, cyclic_objs = dependents_index.sort([(data.id_data, True) for data, _ in updates])
+            updates = [updates_by_obj[obj.as_pointer()] for obj, _ in sorted_objs] \
+                + [updates_by_obj[obj.as_pointer()] for obj in cyclic_objs]
+
+        context = bpy.context
+        for data, funcs in updates:
+            try:
+                if len(funcs) == 1:
+                    funcs[0](data, context)
+                else:
+                    data.regenerate(context)
+            except ReferenceError:
+                # The object was removed during the transaction
+                continue
+
+    def clear(self):
+        self.updates.clear()
+
+
+update_transactions = UpdateTransactions()
+
+
+def transaction(batch=False):
+    """Defers the property updates of all objects, regenerating each touched object once when the transaction closes.
+
+        with transaction(batch=True):
+            for obj in objs:
+                obj.blablacad_data.sinegear_data.teeth_count = 12
+    """
+    return update_transactions.transaction(batch=batch)
+
+
+@bpy.app.handlers.persistent
+def clear_update_transactions(_):
+    update_transactions.clear()
+
+
+def register():
+    update_transactions.clear()
+    append_file_handler(clear_update_transactions)
+
+
+def unregister():
+    remove_file_handler(clear_update_transactions)
+    update_transactions.clear()
@@ -3,6 +3,18 @@ import hashlib
 import math
 from array import array
 
+from .scheduler import sync_scheduler
+from .transactions import update_transactions
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NUMPY_DTYPES = {"b": "bool", "f": "float32", "i": "int32"}
+
+FINGERPRINT_SAMPLES = 64
+
 
 def r(x, y, center=None):
     center_x, center_y = center or (0, 0)
@@ -25,47 +37,248 @@ class Lockable:
     def unlock(self):
         del self["lock"]
 
+    def transaction(self):
+        # Updates are deferred instead of dropped like when locked, the object regenerates once when it closes
+        return update_transactions.transaction(self)
+
+
+class ObjectCache:
+    """Values kept in memory between the syncs of an object, keyed by object pointer and sync state."""
+
+    def __init__(self, free=None):
+        self.entries = dict()
+        self.free = free
+
+    def get(self, obj, state):
+        entry = self.entries.get(obj.as_pointer())
+        return entry[1] if entry is not None and entry[0] == state else None
+
+    def set(self, obj, state, value):
+        self.discard(obj)
+        self.entries[obj.as_pointer()] = (state, value)
+
+    def discard(self, obj):
+        entry = self.entries.pop(obj.as_pointer(), None)
+        if entry is not None and self.free is not None:
+            self.free(entry[1])
+
+    def clear(self):
+        if self.free is not None:
+            for _, value in self.entries.values():
+                self.free(value)
+        self.entries.clear()
+
 
 def if_unlocked(func):
     def _if_unlocked(self, context):
         if not self.get("lock", False):
-            func(self, context)
+            if update_transactions.is_open(self):
+                update_transactions.record(self, func)
+            else:
+                func(self, context)
 
     return _if_unlocked
 
 
-def hash_curve(hash_algo, curve: bpy.types.Curve):
-    spline: bpy.types.Spline
-    point: bpy.types.SplinePoint
-    bezier_point: bpy.types.BezierSplinePoint
+def copy_property_group(to_group, from_group, exclude=()):
+    # Writable properties only, collections and nested groups are left as they are
+    for prop in from_group.bl_rna.properties:
+        if prop.identifier != "rna_type" and prop.identifier not in exclude and not prop.is_readonly:
+            setattr(to_group, prop.identifier, getattr(from_group, prop.identifier))
+
+
+def copy_struct_settings(to_struct, from_struct, exclude=()):
+    # Like copy_property_group for Blender structs, whose writable properties may only accept values in some states
+    for prop in from_struct.bl_rna.properties:
+        if prop.identifier != "rna_type" and prop.identifier not in exclude and not prop.is_readonly:
+            try:
+                setattr(to_struct, prop.identifier, getattr(from_struct, prop.identifier))
+            except (AttributeError, RuntimeError, TypeError, ValueError):
+                pass
+
+
+def add_synced_objects(context, settings, source_objs, suffix, new_data, setup_obj):
+    # All objects are created and set up before any of them is synced, then synced together in a single pass
+    objs = list()
+    for source_obj in source_objs:
+        obj = new_object(context, source_obj.name + suffix, new_data())
+        setup_obj(obj, source_obj, settings)
+        objs.append(obj)
+    sync_scheduler.sync([(obj, True) for obj in objs], context)
+
+    for source_obj in source_objs:
+        source_obj.select_set(False)
+    for obj in objs:
+        obj.select_set(True)
+    context.view_layer.objects.active = objs[-1]
+    return objs
+
+
+def new_object(context, name, data):
+    # Unlike object_data_add, does not deselect every object, which is quadratic when adding objects in a loop
+    obj = bpy.data.objects.new(name, data)
+    obj.location = context.scene.cursor.location
+    context.collection.objects.link(obj)
+    return obj
+
+
+def new_buffer(typecode, size):
+    if numpy is not None:
+        return numpy.zeros(size, dtype=NUMPY_DTYPES[typecode])
+    return array(typecode, bytes(size * array(typecode).itemsize))
+
+
+def foreach_get(collection, attribute, typecode, components=1):
+    buffer = new_buffer(typecode, len(collection) * components)
+    collection.foreach_get(attribute, buffer)
+    return buffer
+
+
+def fingerprint_coordinates(hash_algo, co, components, samples):
+    # Bounding box and a strided sample of the points, with the same bytes for NumPy and array buffers
+    count = len(co) // components
+    stride = max(1, count // samples)
+    if numpy is not None:
+        points = co.reshape(-1, components)
+        if count > 0:
+            hash_algo.update(points.min(axis=0))
+            hash_algo.update(points.max(axis=0))
+        hash_algo.update(numpy.ascontiguousarray(points[::stride]))
+    else:
+        axes = [co[axis::components] for axis in range(components)]
+        if count > 0:
+            hash_algo.update(array(co.typecode, [min(axis) for axis in axes]))
+            hash_algo.update(array(co.typecode, [max(axis) for axis in axes]))
+        hash_algo.update(array(co.typecode, [component
+                                             for i in range(0, count, stride)
+                                             for component in co[i * components:(i + 1) * components]]))
+
+
+BEZIER_POINT_GEOMETRY = (
+    ("co", "f", 3),
+    ("handle_left", "f", 3),
+    ("handle_right", "f", 3),
+    ("tilt", "f", 1),
+    ("radius", "f", 1),
+    ("weight_softbody", "f", 1),
+)
+
+BEZIER_POINT_STATE = (
+    ("hide", "b", 1),
+    ("select_control_point", "b", 1),
+    ("select_left_handle", "b", 1),
+    ("select_right_handle", "b", 1),
+)
+
+SPLINE_POINT_GEOMETRY = (
+    ("co", "f", 4),
+    ("tilt", "f", 1),
+    ("radius", "f", 1),
+    ("weight", "f", 1),
+)
+
+SPLINE_POINT_STATE = (
+    ("hide", "b", 1),
+    ("select", "b", 1),
+)
+
 
-    hash_algo.update(array("l", [curve.resolution_u, curve.resolution_v]))
+def spline_points(spline: bpy.types.Spline):
+    if spline.type == "BEZIER":
+        return spline.bezier_points, BEZIER_POINT_GEOMETRY, BEZIER_POINT_STATE
+    else:
+        return spline.points, SPLINE_POINT_GEOMETRY, SPLINE_POINT_STATE
+
+
+def bezier_handle_types(points):
+    # Enum properties have no raw array access, handle types are read and written point by point
+    return [(point.handle_left_type, point.handle_right_type) for point in points]
+
+
+def spline_buffers(spline: bpy.types.Spline):
+    # Point geometry read once, so that a spline can be hashed and copied from the same buffers
+    points, geometry, _ = spline_points(spline)
+    buffers = {attribute: foreach_get(points, attribute, typecode, components)
+               for attribute, typecode, components in geometry}
+    if spline.type == "BEZIER":
+        buffers["handle_types"] = bezier_handle_types(points)
+    return buffers
+
+
+def hash_spline(hash_algo, spline: bpy.types.Spline, buffers=None):
+    points, geometry, _ = spline_points(spline)
+    buffers = buffers or spline_buffers(spline)
+
+    hash_algo.update(bytes(spline.type, "ascii"))
+    hash_algo.update(bytes(spline.radius_interpolation, "ascii"))
+    hash_algo.update(bytes(spline.tilt_interpolation, "ascii"))
+    hash_algo.update(array("q", [
+        spline.order_u, spline.order_v, spline.resolution_u,
+        spline.resolution_v, spline.use_bezier_u,
+        spline.use_bezier_v, spline.use_cyclic_u, spline.use_cyclic_v,
+        spline.use_endpoint_u, spline.use_endpoint_v, spline.use_smooth,
+        len(points)]))
+    if spline.type == "BEZIER":
+        hash_algo.update(bytes(" ".join(handle_type
+                                        for handle_types in buffers["handle_types"]
+                                        for handle_type in handle_types), "ascii"))
+    for attribute, _, _ in geometry:
+        hash_algo.update(buffers[attribute])
+
+
+def hash_curve_settings(hash_algo, curve: bpy.types.Curve):
+    hash_algo.update(array("q", [curve.resolution_u, curve.resolution_v]))
     hash_algo.update(bytes(curve.dimensions, "ascii"))
+
+
+def fingerprint_curve(hash_algo, curve: bpy.types.Curve):
+    spline: bpy.types.Spline
+
+    samples = max(1, FINGERPRINT_SAMPLES // max(1, len(curve.splines)))
+    hash_algo.update(array("q", [len(curve.splines)]))
     for spline in curve.splines:
+        points = spline_points(spline)[0]
+        components = 3 if spline.type == "BEZIER" else 4
         hash_algo.update(bytes(spline.type, "ascii"))
-        hash_algo.update(bytes(spline.radius_interpolation, "ascii"))
-        hash_algo.update(bytes(spline.tilt_interpolation, "ascii"))
-        hash_algo.update(array("l", [
-            spline.order_u, spline.order_v, spline.resolution_u,
-            spline.resolution_v, spline.use_bezier_u,
-            spline.use_bezier_v, spline.use_cyclic_u, spline.use_cyclic_v,
-            spline.use_endpoint_u, spline.use_endpoint_v, spline.use_smooth]))
-        for bezier_point in spline.bezier_points:
-            hash_algo.update(array("d", bezier_point.co))
-            hash_algo.update(array("d", bezier_point.handle_left))
-            hash_algo.update(array("d", bezier_point.handle_right))
-            hash_algo.update(bytes(bezier_point.handle_right_type, "ascii"))
-            hash_algo.update(bytes(bezier_point.handle_left_type, "ascii"))
-        for point in spline.points:
-            hash_algo.update(array("d", point.co))
-            hash_algo.update(array("d", [point.tilt, point.weight]))
-
-
-def copy_curve(to_curve: bpy.types.Curve, from_curve: bpy.types.Curve):
-    from_spline: bpy.types.Spline
-    from_point: bpy.types.SplinePoint
-    from_bezier_point: bpy.types.BezierSplinePoint
+        hash_algo.update(array("q", [len(points), spline.use_cyclic_u]))
+        fingerprint_coordinates(hash_algo, foreach_get(points, "co", "f", components), components, samples)
+
+
+def copy_spline(to_curve: bpy.types.Curve, from_spline: bpy.types.Spline, buffers=None):
+    from_points, geometry, state = spline_points(from_spline)
+    buffers = buffers or spline_buffers(from_spline)
+    to_spline: bpy.types.Spline = to_curve.splines.new(from_spline.type)
+    to_points = spline_points(to_spline)[0]
+
+    to_points.add(len(from_points) - 1)
+    if from_spline.type == "BEZIER":
+        # Handle types come first so that writing them does not recompute the handles copied next
+        for to_point, (handle_left_type, handle_right_type) in zip(to_points, buffers["handle_types"]):
+            to_point.handle_left_type = handle_left_type
+            to_point.handle_right_type = handle_right_type
+    for attribute, _, _ in geometry:
+        to_points.foreach_set(attribute, buffers[attribute])
+    for attribute, typecode, components in state:
+        to_points.foreach_set(attribute, foreach_get(from_points, attribute, typecode, components))
 
+    to_spline.hide = from_spline.hide
+    to_spline.order_u = from_spline.order_u
+    to_spline.order_v = from_spline.order_v
+    to_spline.radius_interpolation = from_spline.radius_interpolation
+    to_spline.resolution_u = from_spline.resolution_u
+    to_spline.resolution_v = from_spline.resolution_v
+    to_spline.tilt_interpolation = from_spline.tilt_interpolation
+    to_spline.use_bezier_u = from_spline.use_bezier_u
+    to_spline.use_bezier_v = from_spline.use_bezier_v
+    to_spline.use_cyclic_u = from_spline.use_cyclic_u
+    to_spline.use_cyclic_v = from_spline.use_cyclic_v
+    to_spline.use_endpoint_u = from_spline.use_endpoint_u
+    to_spline.use_endpoint_v = from_spline.use_endpoint_v
+    to_spline.use_smooth = from_spline.use_smooth
+    return to_spline
+
+
+def copy_curve_settings(to_curve: bpy.types.Curve, from_curve: bpy.types.Curve):
     if len(to_curve.splines) > 0:
         to_curve.splines.clear()
 
@@ -73,69 +286,76 @@ def copy_curve(to_curve: bpy.types.Curve, from_curve: bpy.types.Curve):
     to_curve.resolution_u = from_curve.resolution_u
     to_curve.resolution_v = from_curve.resolution_v
 
-    for from_spline in from_curve.splines:
-        to_spline: bpy.types.Spline = to_curve.splines.new(from_spline.type)
-        if to_spline.type == "BEZIER":
-            to_spline.bezier_points.add(len(from_spline.bezier_points) - 1)
-            for i, from_bezier_point in enumerate(from_spline.bezier_points):
-                to_spline.bezier_points[i].co = from_bezier_point.co
-                to_spline.bezier_points[i].handle_left_type = from_bezier_point.handle_left_type
-                to_spline.bezier_points[i].handle_left = from_bezier_point.handle_left
-                to_spline.bezier_points[i].handle_right_type = from_bezier_point.handle_right_type
-                to_spline.bezier_points[i].handle_right = from_bezier_point.handle_right
-                to_spline.bezier_points[i].hide = from_bezier_point.hide
-                to_spline.bezier_points[i].radius = from_bezier_point.radius
-                to_spline.bezier_points[i].select_control_point = from_bezier_point.select_control_point
-                to_spline.bezier_points[i].select_left_handle = from_bezier_point.select_left_handle
-                to_spline.bezier_points[i].select_right_handle = from_bezier_point.select_right_handle
-                to_spline.bezier_points[i].tilt = from_bezier_point.tilt
-                to_spline.bezier_points[i].weight_softbody = from_bezier_point.weight_softbody
+
+# Bevel weights and creases, element properties until Blender 4.0 and optional float attributes since
+MESH_WEIGHTS = (
+    ("vertices", bpy.types.MeshVertex, "bevel_weight", "bevel_weight_vert"),
+    ("edges", bpy.types.MeshEdge, "bevel_weight", "bevel_weight_edge"),
+    ("edges", bpy.types.MeshEdge, "crease", "crease_edge"),
+)
+
+
+def mesh_weights(mesh: bpy.types.Mesh, per_element=False):
+    buffers = list()
+    for elements_name, element_type, property_name, attribute_name in MESH_WEIGHTS:
+        if property_name in element_type.bl_rna.properties:
+            elements = getattr(mesh, elements_name)
+        else:
+            attribute = mesh.attributes.get(attribute_name)
+            elements, property_name = (attribute.data if attribute is not None else list()), "value"
+        if per_element or len(elements) == 0:
+            buffers.append(array("f", [getattr(element, property_name) for element in elements]))
         else:
-            to_spline.points.add(len(from_spline.points) - 1)
-            for i, from_point in enumerate(from_spline.points):
-                to_spline.points[i].co = from_point.co
-                to_spline.points[i].hide = from_point.hide
-                to_spline.points[i].tilt = from_point.tilt
-                to_spline.points[i].weight = from_point.weight
-
-        to_spline.hide = from_spline.hide
-        to_spline.order_u = from_spline.order_u
-        to_spline.order_v = from_spline.order_v
-        to_spline.radius_interpolation = from_spline.radius_interpolation
-        to_spline.resolution_u = from_spline.resolution_u
-        to_spline.resolution_v = from_spline.resolution_v
-        to_spline.tilt_interpolation = from_spline.tilt_interpolation
-        to_spline.use_bezier_u = from_spline.use_bezier_u
-        to_spline.use_bezier_v = from_spline.use_bezier_v
-        to_spline.use_cyclic_u = from_spline.use_cyclic_u
-        to_spline.use_cyclic_v = from_spline.use_cyclic_v
-        to_spline.use_endpoint_u = from_spline.use_endpoint_u
-        to_spline.use_endpoint_v = from_spline.use_endpoint_v
-        to_spline.use_smooth = from_spline.use_smooth
+            buffers.append(foreach_get(elements, property_name, "f"))
+    return buffers
 
 
-def hash_mesh(hash_algo, mesh: bpy.types.Mesh):
+def mesh_buffers(mesh: bpy.types.Mesh):
+    # One contiguous buffer per attribute, NumPy and array buffers of a typecode have the same bytes
+    return [
+        array("q", [len(mesh.vertices), len(mesh.edges), len(mesh.loops), len(mesh.polygons)]),
+        foreach_get(mesh.vertices, "co", "f", 3),
+        foreach_get(mesh.edges, "vertices", "i", 2),
+        foreach_get(mesh.edges, "use_edge_sharp", "b"),
+        foreach_get(mesh.edges, "use_seam", "b"),
+        foreach_get(mesh.loops, "vertex_index", "i"),
+        foreach_get(mesh.loops, "edge_index", "i"),
+        foreach_get(mesh.polygons, "loop_start", "i"),
+        foreach_get(mesh.polygons, "loop_total", "i"),
+        foreach_get(mesh.polygons, "use_smooth", "b"),
+    ] + mesh_weights(mesh)
+
+
+def mesh_buffers_per_element(mesh: bpy.types.Mesh):
     edge: bpy.types.MeshEdge
     vertex: bpy.types.MeshVertex
     loop: bpy.types.MeshLoop
     polygon: bpy.types.MeshPolygon
 
-    for vertex in mesh.vertices:
-        hash_algo.update(array("d", [vertex.bevel_weight]))
-        hash_algo.update(array("d", vertex.co))
-        hash_algo.update(array("d", vertex.normal))
-
-    for edge in mesh.edges:
-        hash_algo.update(array("d", [edge.bevel_weight, edge.crease, edge.crease]))
-        hash_algo.update(array("l", edge.vertices))
-        hash_algo.update(array("l", [edge.is_loose, edge.use_edge_sharp, edge.use_seam]))
-
-    for loop in mesh.loops:
-        hash_algo.update(array("l", [loop.edge_index, loop.vertex_index]))
-        hash_algo.update(array("d", loop.normal))
-
-    for polygon in mesh.polygons:
-        hash_algo.update(array("d", [polygon.loop_start, polygon.loop_total]))
-        hash_algo.update(array("d", polygon.normal))
-        hash_algo.update(array("l", [polygon.use_smooth]))
-        hash_algo.update(array("l", polygon.vertices))
+    return [
+        array("q", [len(mesh.vertices), len(mesh.edges), len(mesh.loops), len(mesh.polygons)]),
+        array("f", [component for vertex in mesh.vertices for component in vertex.co]),
+        array("i", [index for edge in mesh.edges for index in edge.vertices]),
+        array("b", [edge.use_edge_sharp for edge in mesh.edges]),
+        array("b", [edge.use_seam for edge in mesh.edges]),
+        array("i", [loop.vertex_index for loop in mesh.loops]),
+        array("i", [loop.edge_index for loop in mesh.loops]),
+        array("i", [polygon.loop_start for polygon in mesh.polygons]),
+        array("i", [polygon.loop_total for polygon in mesh.polygons]),
+        array("b", [polygon.use_smooth for polygon in mesh.polygons]),
+    ] + mesh_weights(mesh, per_element=True)
+
+
+def fingerprint_mesh(hash_algo, mesh: bpy.types.Mesh):
+    hash_algo.update(array("q", [len(mesh.vertices), len(mesh.edges), len(mesh.loops), len(mesh.polygons)]))
+    fingerprint_coordinates(hash_algo, foreach_get(mesh.vertices, "co", "f", 3), 3, FINGERPRINT_SAMPLES)
+
+
+def hash_mesh(hash_algo, mesh: bpy.types.Mesh):
+    try:
+        buffers = mesh_buffers(mesh)
+    except (AttributeError, RuntimeError, TypeError):
+        buffers = mesh_buffers_per_element(mesh)
+
+    for buffer in buffers:
+        hash_algo.update(buffer)
@@ -0,0 +1,114 @@
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+
+import bpy
+
+POLL_INTERVAL = 0.05
+WORKER_MODULE = "blablacad_offset_worker"
+WORKER_MODULE_PATH = os.path.join(os.path.dirname(__file__), "offset.py")
+
+# Workers are spawned without the add-on package, which imports bpy. The offset module only depends on NumPy and is
+# loaded standalone under a name of its own, both in the workers and in Blender so that jobs pickle by reference.
+WORKER_BOOTSTRAP = """
+import importlib.util
+import sys
+
+if module_name not in sys.modules:
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+"""
+
+
+def load_worker_module():
+    exec(WORKER_BOOTSTRAP, {"module_name": WORKER_MODULE, "module_path": WORKER_MODULE_PATH})
+    return sys.modules[WORKER_MODULE]
+
+
+class OffsetWorkers:
+    """Computes offset traces in background processes, calling back with the traces or None on the main thread."""
+
+    def __init__(self):
+        self.executor = None
+        self.max_workers = 0
+        self.is_broken = False
+        self.pending = dict()
+        self.timer = self.poll
+
+    def submit(self, key, args, callback, max_workers):
+        if self.is_broken:
+            return False
+        if key in self.pending:
+            self.pending[key][1].append(callback)
+            return True
+
+        try:
+            if self.executor is None or self.max_workers != max_workers:
+                if self.executor is not None:
+                    # Jobs already submitted still complete in the previous pool
+                    self.executor.shutdown(wait=False)
+                self.executor = self.make_executor(max_workers)
+                self.max_workers = max_workers
+            future = self.executor.submit(load_worker_module().offset_polyline, *args)
+        except (OSError, RuntimeError) as error:
+            print("BlaBlaCAD: background offset disabled, %s" % error)
+            self.is_broken = True
+            return False
+
+        self.pending[key] = (future, [callback])
+        if not bpy.app.timers.is_registered(self.timer):
+            bpy.app.timers.register(self.timer, first_interval=POLL_INTERVAL)
+        return True
+
+    @staticmethod
+    def make_executor(max_workers):
+        context = multiprocessing.get_context("spawn")
+        # Before 2.91, sys.executable is Blender itself and the bundled Python interpreter is exposed separately
+        python = getattr(bpy.app, "binary_path_python", None)
+        if python:
+            context.set_executable(python)
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers or max(1, (os.cpu_count() or 2) - 1),
+            mp_context=context,
+            initializer=exec,
+            initargs=(WORKER_BOOTSTRAP, {"module_name": WORKER_MODULE, "module_path": WORKER_MODULE_PATH}))
+
+    def poll(self):
+        done = [(key, future, callbacks) for key, (future, callbacks) in self.pending.items() if future.done()]
+        for key, future, callbacks in done:
+            del self.pending[key]
+            try:
+                traces = future.result()
+            except Exception as error:
+                # A failing pool falls back to computing offsets in Blender, callbacks are told to do so
+                print("BlaBlaCAD: background offset failed, %s" % error)
+                if isinstance(error, concurrent.futures.process.BrokenProcessPool):
+                    self.is_broken = True
+                traces = None
+            for callback in callbacks:
+                callback(key, traces)
+        return POLL_INTERVAL if self.pending else None
+
+    def shutdown(self):
+        if bpy.app.timers.is_registered(self.timer):
+            bpy.app.timers.unregister(self.timer)
+        for future, _ in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+offset_workers = OffsetWorkers()
+
+
+def register():
+    offset_workers.is_broken = False
+
+
+def unregister():
+    offset_workers.shutdown()